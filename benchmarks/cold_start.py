@@ -0,0 +1,96 @@
+import argparse
+import json
+import os
+import shutil
+import statistics
+import subprocess
+import sys
+import tempfile
+from pathlib import Path
+
+from benchmarks.fake_api import FakeGlobalFootprintNetworkAPI, add_config_arguments, config_from_arguments
+
+ROOT_PATH = Path(__file__).resolve().parent.parent
+HANDLERS = {
+    "api_request": ("src.raw.global_footprint_network.handler", "api_request_handler", {}),
+    "ingestion": (
+        "src.raw.global_footprint_network.handler",
+        "ingestion_handler",
+        {"file_path": "data/ingestion/benchmark.json", "data": [{"year": 2010, "countryCode": "1"}]},
+    ),
+    "trusted": ("src.trusted.global_footprint_network.handler", "handler", {}),
+}
+# Runs in a fresh interpreter: time the handler module import, a cold and a warm invocation
+CHILD_CODE = """
+import json, sys, time
+start = time.perf_counter()
+module = __import__({module!r}, fromlist=[{function!r}])
+imported = time.perf_counter()
+heavy_modules = [name for name in ("pandas", "duckdb", "requests") if name in sys.modules]
+handler = getattr(module, {function!r})
+handler({event!r})
+cold = time.perf_counter()
+handler({event!r})
+warm = time.perf_counter()
+print(json.dumps({{
+    "import_seconds": imported - start,
+    "cold_invocation_seconds": cold - imported,
+    "warm_invocation_seconds": warm - cold,
+    "modules_at_import": heavy_modules,
+}}))
+"""
+
+
+def time_handler(name: str, env: dict[str, str], verbose: bool) -> dict:
+    module, function, event = HANDLERS[name]
+    completed = subprocess.run(
+        [sys.executable, "-c", CHILD_CODE.format(module=module, function=function, event=event)],
+        cwd=ROOT_PATH,
+        env=env,
+        stdout=subprocess.PIPE,
+        stderr=None if verbose else subprocess.DEVNULL,
+        text=True,
+        check=True,
+    )
+    return json.loads(completed.stdout.strip().splitlines()[-1])
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Time cold starts and warm invocations of the stage handlers")
+    add_config_arguments(parser)
+    parser.set_defaults(countries=20, end_year=2011)
+    parser.add_argument("--handlers", default="api_request,ingestion,trusted", help="Comma separated handlers")
+    parser.add_argument("--repeat", type=int, default=5, help="Number of cold starts, the median is reported")
+    parser.add_argument("--verbose", action="store_true", help="Show the logs of the handlers")
+    args = parser.parse_args()
+
+    api = FakeGlobalFootprintNetworkAPI(config=config_from_arguments(args))
+    api.start()
+    work_path = Path(tempfile.mkdtemp(prefix="carbon-footprint-cold-start-"))
+    env = {
+        **os.environ,
+        "PYTHONPATH": str(ROOT_PATH),
+        "API_BASE_URL": api.base_url,
+        "UPDATE_COUNTRIES": "True",
+        "START_YEAR": str(args.start_year),
+        "END_YEAR": str(args.end_year),
+        "RAW_PATH": str(work_path / "raw"),
+        "DATABASE_PATH": str(work_path / "database.db"),
+        "PARQUET_PATH": str(work_path / "trusted"),
+        "CHECKPOINT": "False",
+    }
+    try:
+        print(f"{'handler':<14}{'import s':>10}{'cold s':>10}{'warm s':>10}  modules at import")
+        for name in args.handlers.split(","):
+            runs = [time_handler(name=name, env=env, verbose=args.verbose) for _ in range(args.repeat)]
+            medians = {
+                metric: statistics.median(run[metric] for run in runs)
+                for metric in ["import_seconds", "cold_invocation_seconds", "warm_invocation_seconds"]
+            }
+            print(
+                f"{name:<14}{medians['import_seconds']:>10.3f}{medians['cold_invocation_seconds']:>10.3f}"
+                f"{medians['warm_invocation_seconds']:>10.3f}  {', '.join(runs[0]['modules_at_import']) or '-'}"
+            )
+    finally:
+        api.stop()
+        shutil.rmtree(work_path, ignore_errors=True)
@@ -0,0 +1,210 @@
+import argparse
+import json
+import random
+import threading
+import time
+import zlib
+from dataclasses import dataclass, field
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from src.trusted.global_footprint_network.schema import RECORDS
+
+
+@dataclass
+class FakeAPIConfig:
+    """
+    Shape of the fake Global Footprint Network API.
+
+    Args:
+        countries: Number of countries returned by /countries, with codes 1..countries
+        start_year: First year returned by /years
+        end_year: Last year returned by /years
+        latency: Seconds to wait before answering each request
+        error_rate: Probability of answering a /data request with HTTP 500
+        years_without_all: Years where /data/all/{year} returns an empty list, forcing per-country requests
+        seed: Seed of the error generator, so runs are repeatable
+    """
+
+    countries: int = 200
+    start_year: int = 2010
+    end_year: int = 2024
+    latency: float = 0.0
+    error_rate: float = 0.0
+    years_without_all: set[int] = field(default_factory=set)
+    seed: int = 0
+
+
+class FakeGlobalFootprintNetworkAPI:
+    """Local HTTP server mimicking the /countries, /years and /data/{country}/{year} endpoints."""
+
+    def __init__(self, config: FakeAPIConfig, host: str = "127.0.0.1", port: int = 0):
+        self.config = config
+        self.requests = 0
+        self.bytes_sent = 0
+        self._lock = threading.Lock()
+        self._random = random.Random(config.seed)
+        self._server = ThreadingHTTPServer((host, port), self.__build_handler())
+        self._server.daemon_threads = True
+        self._thread: threading.Thread | None = None
+
+    @property
+    def base_url(self) -> str:
+        host, port = self._server.server_address[:2]
+        return f"http://{host}:{port}/v1"
+
+    def start(self) -> str:
+        """Serve requests in a background thread and return the base URL."""
+        self._thread = threading.Thread(target=self._server.serve_forever, daemon=True)
+        self._thread.start()
+        return self.base_url
+
+    def serve_forever(self) -> None:
+        """Serve requests in the current thread until interrupted."""
+        self._server.serve_forever()
+
+    def stop(self) -> None:
+        self._server.shutdown()
+        self._server.server_close()
+
+    def reset_stats(self) -> None:
+        """Reset the request counters and the error generator, so every run sees the same failures."""
+        with self._lock:
+            self.requests = 0
+            self.bytes_sent = 0
+            self._random.seed(self.config.seed)
+
+    def countries(self) -> list[dict]:
+        countries = [self.__country(code) for code in range(1, self.config.countries + 1)]
+        return countries + [{"countryCode": "all", "countryName": "World", "shortName": "World", "isoa2": None}]
+
+    def years(self) -> list[dict]:
+        return [{"year": year} for year in range(self.config.start_year, self.config.end_year + 1)]
+
+    def data(self, country_code: str, year: int) -> list[dict]:
+        if country_code == "all":
+            if year in self.config.years_without_all:
+                return []
+            codes = range(1, self.config.countries + 1)
+        else:
+            codes = [int(country_code)]
+        return [self.__record(code, year, record) for code in codes for record in RECORDS]
+
+    def should_fail(self) -> bool:
+        with self._lock:
+            return self._random.random() < self.config.error_rate
+
+    def record_request(self, size: int) -> None:
+        with self._lock:
+            self.requests += 1
+            self.bytes_sent += size
+
+    def __country(self, code: int) -> dict:
+        return {
+            "countryCode": str(code),
+            "countryName": f"Country {code}",
+            "shortName": f"C{code}",
+            "isoa2": f"{chr(65 + code % 26)}{chr(65 + code // 26 % 26)}",
+        }
+
+    def __record(self, code: int, year: int, record: str) -> dict:
+        # Deterministic values, so every run produces the same raw files
+        seed = zlib.crc32(f"{code}-{year}-{record}".encode())
+        values = [round(seed % (10**k) / 10 ** (k - 3), 4) for k in range(4, 11)]
+        return {
+            "id": seed,
+            "version": None,
+            "year": year,
+            **self.__country(code),
+            "record": record,
+            "cropLand": values[0],
+            "grazingLand": values[1],
+            "forestLand": values[2],
+            "fishingGround": values[3],
+            "builtupLand": values[4],
+            "carbon": values[5],
+            "value": values[6],
+            "score": "3A",
+        }
+
+    def __build_handler(self) -> type[BaseHTTPRequestHandler]:
+        api = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+
+            def do_GET(self) -> None:
+                if api.config.latency:
+                    time.sleep(api.config.latency)
+                parts = self.path.split("?")[0].strip("/").split("/")[1:]
+                if parts == ["countries"]:
+                    self.__send(200, api.countries())
+                elif parts == ["years"]:
+                    self.__send(200, api.years())
+                elif len(parts) == 3 and parts[0] == "data" and parts[2].isdigit():
+                    if api.should_fail():
+                        self.__send(500, {"error": "Injected failure"})
+                    else:
+                        self.__send(200, api.data(country_code=parts[1], year=int(parts[2])))
+                else:
+                    self.__send(404, {"error": f"Unknown endpoint {self.path}"})
+
+            def __send(self, status: int, body: object) -> None:
+                payload = json.dumps(body).encode("utf-8")
+                api.record_request(len(payload))
+                self.send_response(status)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(payload)))
+                self.end_headers()
+                self.wfile.write(payload)
+
+            def log_message(self, format: str, *args: object) -> None:
+                pass
+
+        return Handler
+
+
+def parse_years(value: str) -> set[int]:
+    """Parse a comma separated list of years or year ranges, e.g. "2010,2015-2017"."""
+    years = set()
+    for part in filter(None, value.split(",")):
+        start, _, end = part.partition("-")
+        years.update(range(int(start), int(end or start) + 1))
+    return years
+
+
+def add_config_arguments(parser: argparse.ArgumentParser) -> None:
+    parser.add_argument("--countries", type=int, default=200, help="Number of countries")
+    parser.add_argument("--start-year", type=int, default=2010, help="First year available")
+    parser.add_argument("--end-year", type=int, default=2024, help="Last year available")
+    parser.add_argument("--latency", type=float, default=0.0, help="Seconds to wait before each response")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="Probability of HTTP 500 on /data requests")
+    parser.add_argument(
+        "--years-without-all", type=parse_years, default=set(), help='Years without "all" data, e.g. 2010,2015-2017'
+    )
+    parser.add_argument("--seed", type=int, default=0, help="Seed of the injected errors")
+
+
+def config_from_arguments(args: argparse.Namespace) -> FakeAPIConfig:
+    return FakeAPIConfig(
+        countries=args.countries,
+        start_year=args.start_year,
+        end_year=args.end_year,
+        latency=args.latency,
+        error_rate=args.error_rate,
+        years_without_all=args.years_without_all,
+        seed=args.seed,
+    )
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Serve a fake Global Footprint Network API")
+    parser.add_argument("--port", type=int, default=8000, help="Port to listen on")
+    add_config_arguments(parser)
+    args = parser.parse_args()
+
+    api = FakeGlobalFootprintNetworkAPI(config=config_from_arguments(args), port=args.port)
+    print(f"Serving fake API on {api.base_url}, set API_BASE_URL to use it")
+    try:
+        api.serve_forever()
+    except KeyboardInterrupt:
+        api.stop()
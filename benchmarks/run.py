@@ -0,0 +1,152 @@
+import argparse
+import json
+import os
+import shutil
+import statistics
+import subprocess
+import sys
+import tempfile
+from pathlib import Path
+
+from benchmarks.fake_api import FakeGlobalFootprintNetworkAPI, add_config_arguments, config_from_arguments
+
+ROOT_PATH = Path(__file__).resolve().parent.parent
+# Throughput metrics compared against a baseline, higher is better
+THROUGHPUT_METRICS = ["requests_per_second", "raw_mb_per_second", "rows_per_second"]
+
+
+def folder_size(path: Path) -> int:
+    return sum(file.stat().st_size for file in path.rglob("*") if file.is_file())
+
+
+def run_stage(stage: str, env: dict[str, str], verbose: bool) -> dict:
+    """Run a stage in a fresh Python process, so peak RSS and imports are measured per stage."""
+    completed = subprocess.run(
+        [sys.executable, "-m", "benchmarks.stage", stage],
+        cwd=ROOT_PATH,
+        env=env,
+        stdout=subprocess.PIPE,
+        stderr=None if verbose else subprocess.DEVNULL,
+        text=True,
+        check=True,
+    )
+    return json.loads(completed.stdout.strip().splitlines()[-1])
+
+
+def run_once(api: FakeGlobalFootprintNetworkAPI, stages: list[str], extra_env: dict[str, str], verbose: bool) -> dict:
+    """Run the stages once on an empty raw bucket and database, returning the measurements of each stage."""
+    work_path = Path(tempfile.mkdtemp(prefix="carbon-footprint-benchmark-"))
+    raw_path = work_path / "raw"
+    env = {
+        **os.environ,
+        "PYTHONPATH": str(ROOT_PATH),
+        "API_BASE_URL": api.base_url,
+        "API_USERNAME": "benchmark",
+        "API_KEY": "benchmark",
+        "UPDATE_COUNTRIES": "True",
+        "START_YEAR": str(api.config.start_year),
+        "END_YEAR": str(api.config.end_year),
+        "RAW_PATH": str(raw_path),
+        "DATABASE_PATH": str(work_path / "database.db"),
+        "PARQUET_PATH": str(work_path / "trusted"),
+        "HTTP_CACHE_PATH": "",
+        **extra_env,
+    }
+    results = {}
+    try:
+        for stage in stages:
+            api.reset_stats()
+            result = run_stage(stage=stage, env=env, verbose=verbose)
+            seconds = result["seconds"]
+            raw_mb = folder_size(raw_path / "data") / 1024**2 if (raw_path / "data").exists() else 0.0
+            if stage == "raw":
+                result["requests"] = api.requests
+                result["requests_per_second"] = api.requests / seconds
+            result["raw_mb"] = raw_mb
+            # Raw MB written by the raw stage, or read by the trusted stage
+            result["raw_mb_per_second"] = raw_mb / seconds
+            if "rows" in result:
+                result["rows_per_second"] = result["rows"] / seconds
+            results[stage] = result
+    finally:
+        shutil.rmtree(work_path, ignore_errors=True)
+    return results
+
+
+def summarize(runs: list[dict]) -> dict:
+    """Median of every measurement of each stage across runs."""
+    summary = {}
+    for stage in runs[0]:
+        metrics = runs[0][stage].keys()
+        summary[stage] = {metric: statistics.median(run[stage][metric] for run in runs) for metric in metrics}
+    return summary
+
+
+def print_summary(summary: dict) -> None:
+    header = f"{'stage':<10}{'seconds':>10}{'requests/s':>12}{'raw MB/s':>10}{'rows/s':>12}{'peak RSS MB':>13}"
+    print(header)
+    print("-" * len(header))
+    for stage, metrics in summary.items():
+        requests_per_second = f"{metrics['requests_per_second']:.1f}" if "requests_per_second" in metrics else "-"
+        rows_per_second = f"{metrics['rows_per_second']:.0f}" if "rows_per_second" in metrics else "-"
+        print(
+            f"{stage:<10}{metrics['seconds']:>10.2f}{requests_per_second:>12}"
+            f"{metrics['raw_mb_per_second']:>10.2f}{rows_per_second:>12}{metrics['peak_rss_mb']:>13.1f}"
+        )
+
+
+def compare_with_baseline(summary: dict, baseline: dict, tolerance: float) -> list[str]:
+    """List the metrics worse than the baseline by more than the tolerance (fraction of the baseline)."""
+    regressions = []
+    for stage, metrics in summary.items():
+        for metric, value in metrics.items():
+            expected = baseline.get(stage, {}).get(metric)
+            if not expected:
+                continue
+            if metric in THROUGHPUT_METRICS and value < expected * (1 - tolerance):
+                regressions.append(f"{stage} {metric}: {value:.2f} < baseline {expected:.2f}")
+            elif metric == "peak_rss_mb" and value > expected * (1 + tolerance):
+                regressions.append(f"{stage} {metric}: {value:.2f} > baseline {expected:.2f}")
+    return regressions
+
+
+def parse_env(value: str) -> tuple[str, str]:
+    key, separator, env_value = value.partition("=")
+    if not separator:
+        raise argparse.ArgumentTypeError(f"Expected KEY=VALUE, got {value}")
+    return key, env_value
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmark the raw and trusted stages against a fake API")
+    add_config_arguments(parser)
+    parser.add_argument("--stages", default="raw,trusted", help="Comma separated stages to run, in order")
+    parser.add_argument("--repeat", type=int, default=3, help="Number of runs, the median is reported")
+    parser.add_argument(
+        "--env", type=parse_env, action="append", default=[], help="Environment setting for the stages, KEY=VALUE"
+    )
+    parser.add_argument("--output", type=Path, help="Save the summary as JSON, to be used as a baseline")
+    parser.add_argument("--baseline", type=Path, help="Fail when a metric regressed from this saved summary")
+    parser.add_argument("--tolerance", type=float, default=0.2, help="Allowed regression from the baseline")
+    parser.add_argument("--verbose", action="store_true", help="Show the logs of the stages")
+    args = parser.parse_args()
+
+    api = FakeGlobalFootprintNetworkAPI(config=config_from_arguments(args))
+    api.start()
+    try:
+        runs = [
+            run_once(api=api, stages=args.stages.split(","), extra_env=dict(args.env), verbose=args.verbose)
+            for _ in range(args.repeat)
+        ]
+    finally:
+        api.stop()
+
+    summary = summarize(runs)
+    print_summary(summary)
+    if args.output:
+        args.output.write_text(json.dumps(summary, indent=2))
+    if args.baseline:
+        regressions = compare_with_baseline(summary, json.loads(args.baseline.read_text()), args.tolerance)
+        for regression in regressions:
+            print(f"Regression: {regression}")
+        sys.exit(1 if regressions else 0)
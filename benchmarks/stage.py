@@ -0,0 +1,51 @@
+import json
+import resource
+import sys
+import time
+
+
+def peak_rss_mb() -> float:
+    """Peak resident memory of this process and its finished children (worker processes), in MB."""
+    peak_kb = max(
+        resource.getrusage(resource.RUSAGE_SELF).ru_maxrss,
+        resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss,
+    )
+    return peak_kb / 1024
+
+
+def run_raw() -> dict:
+    from src.raw.global_footprint_network.api_request import GlobalFootprintNetworkAPIRequest
+
+    api_request = GlobalFootprintNetworkAPIRequest()
+    api_request.execute()
+    return {"errors": len(api_request.ingestion_errors)}
+
+
+def run_trusted() -> dict:
+    from src.common.repositories.aws.parquet import ParquetRepository
+    from src.common.repositories.snowflake.duckdb import DuckDBRepository
+    from src.trusted.global_footprint_network.etl import GlobalFootprintNetworkTrusted
+
+    trusted = GlobalFootprintNetworkTrusted()
+    trusted.execute(full_refresh=True)
+
+    if "duckdb" in trusted.sinks:
+        repository = DuckDBRepository(database_path=trusted.environment.DATABASE_PATH)
+        rows = repository.connection.execute(f"SELECT COUNT(*) FROM {trusted.TABLE_NAME}").fetchone()[0]
+        repository.close_connection()
+    else:
+        rows = len(ParquetRepository(base_path=trusted.parquet_repository.base_path).read(columns=["year"]))
+    return {"rows": rows}
+
+
+STAGES = {"raw": run_raw, "trusted": run_trusted}
+
+
+if __name__ == "__main__":
+    # Run a single stage and print its measurements as JSON on the last line of stdout
+    stage = sys.argv[1]
+    start = time.perf_counter()
+    result = STAGES[stage]()
+    result["seconds"] = time.perf_counter() - start
+    result["peak_rss_mb"] = peak_rss_mb()
+    print(json.dumps(result))
@@ -0,0 +1,107 @@
+import threading
+import time
+
+from src.common.repositories.aws.s3 import S3Repository
+
+
+class AvailabilityIndex(S3Repository):
+    """
+    Availability index of the API: which (year, country_code) pairs returned data, were empty or failed.
+    Negative entries (empty or error) expire, so pairs are requested again once their entry is stale.
+    The list of valid years is also kept, to avoid requesting it on every run.
+    """
+
+    INDEX_FILE = "availability/index.json"
+    DATA = "data"
+    EMPTY = "empty"
+    ERROR = "error"
+
+    def __init__(self, bucket_name: str, empty_ttl: float, error_ttl: float, years_ttl: float):
+        """
+        Args:
+            bucket_name: Bucket where the index is stored
+            empty_ttl: Seconds an empty pair is skipped before being requested again
+            error_ttl: Seconds a failed pair is skipped before being requested again
+            years_ttl: Seconds the list of valid years is reused before being requested again
+        """
+        super().__init__(bucket_name, raw_format="json-min")
+        self.ttl_by_status = {self.EMPTY: empty_ttl, self.ERROR: error_ttl}
+        self.years_ttl = years_ttl
+        self._lock = threading.Lock()
+        self._pairs: dict[int, dict[str, dict]] = {}
+        self._years: dict = {}
+        self.skipped = 0
+
+    def load(self) -> None:
+        try:
+            index = self.get_file(file_path=self.INDEX_FILE)
+        except FileNotFoundError:
+            index = {"pairs": {}, "years": {}}
+        with self._lock:
+            self._pairs = {int(year): entries for year, entries in index["pairs"].items()}
+            self._years = index["years"]
+            self.skipped = 0
+
+    def flush(self) -> None:
+        """Save the index."""
+        with self._lock:
+            index = {
+                "pairs": {str(year): entries for year, entries in sorted(self._pairs.items())},
+                "years": self._years,
+            }
+            self.upload_file(file_path=self.INDEX_FILE, data=index)
+
+    def record(self, year: int, country_code: str, status: str) -> None:
+        """Record the outcome of a request: DATA, EMPTY or ERROR."""
+        with self._lock:
+            self._pairs.setdefault(year, {})[country_code] = {"status": status, "checked_at": time.time()}
+
+    def record_payload(self, year: int, country_code: str, data: list | None, error: Exception | None) -> None:
+        """Record the outcome of a request from its payload or error."""
+        status = self.ERROR if error is not None else self.DATA if data else self.EMPTY
+        self.record(year=year, country_code=country_code, status=status)
+
+    def is_known_unavailable(self, year: int, country_code: str) -> bool:
+        """Check if a pair was empty or failed recently enough to skip it. Skipped pairs are counted in skipped."""
+        with self._lock:
+            entry = self._pairs.get(year, {}).get(country_code)
+            if entry is None or entry["status"] == self.DATA:
+                return False
+            is_unavailable = time.time() - entry["checked_at"] < self.ttl_by_status[entry["status"]]
+            self.skipped += is_unavailable
+            return is_unavailable
+
+    def prioritize(self, year: int, countries_codes: list[str]) -> list[str]:
+        """
+        Drop pairs known to be unavailable and order the others by how likely they are to have new data:
+        countries with data in other years first, then countries never seen, then pairs already requested this year.
+        """
+        with self._lock:
+            countries_with_data = {
+                code
+                for entries in self._pairs.values()
+                for code, entry in entries.items()
+                if entry["status"] == self.DATA
+            }
+            year_entries = dict(self._pairs.get(year, {}))
+
+        def priority(country_code: str) -> int:
+            if country_code in year_entries:
+                return 2
+            return 0 if country_code in countries_with_data else 1
+
+        pending_codes = [
+            code for code in countries_codes if not self.is_known_unavailable(year=year, country_code=code)
+        ]
+        return sorted(pending_codes, key=priority)
+
+    def cached_years(self) -> list[int] | None:
+        """Get the valid years saved less than years_ttl seconds ago, None if missing or stale."""
+        with self._lock:
+            if not self._years or time.time() - self._years["checked_at"] >= self.years_ttl:
+                return None
+            return list(self._years["values"])
+
+    def record_years(self, years: list[int]) -> None:
+        with self._lock:
+            self._years = {"values": years, "checked_at": time.time()}
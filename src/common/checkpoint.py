@@ -1,40 +1,98 @@
+import threading
+import time
 from typing import Any
 
 from src.common.repositories.aws.s3 import S3Repository
 
 
 class Checkpoint(S3Repository):
-    """Checkpoint class for the application."""
+    """
+    Checkpoint class for the application.
 
-    CHECKPOINT_FILE = "checkpoint.json"
-    CHECKPOINT_FOLDER = "checkpoints"
+    Keeps a completion manifest with the set of country codes completed per year, so items can finish
+    in any order and resuming only requests the missing (year, country_code) pairs.
+    """
 
-    def __init__(self, bucket_name: str):
-        super().__init__(bucket_name)
+    MANIFEST_FILE = "manifest.json"
+    LEGACY_CHECKPOINT_FILE = "checkpoint.json"
+    CHECKPOINT_FOLDER = "checkpoints"
 
-    def save_checkpoint(self, year: int, country_code: str) -> None:
+    def __init__(self, bucket_name: str, flush_every_items: int = 50, flush_every_seconds: float = 30.0):
         """
-        Save a checkpoint with the current year and country code.
-        This allows resuming data ingestion from the last successful state.
-
         Args:
-            year: The year being processed
-            country_code: The country code being processed
+            bucket_name: Bucket where the manifest is stored
+            flush_every_items: Save the manifest after this many newly completed items
+            flush_every_seconds: Save the manifest when this many seconds passed since the last save
         """
-        checkpoint_data = {"year": year, "country_code": country_code}
-        self.upload_file(file_path=f"{self.CHECKPOINT_FOLDER}/{self.CHECKPOINT_FILE}", data=checkpoint_data)
+        super().__init__(bucket_name, raw_format="json-min")
+        self.flush_every_items = flush_every_items
+        self.flush_every_seconds = flush_every_seconds
+        self._lock = threading.Lock()
+        self._completed: dict[int, set[str]] = {}
+        self._legacy_checkpoint: dict[str, Any] = {}
+        self._unsaved_items = 0
+        self._last_flush = time.monotonic()
 
-    def get_checkpoint(self) -> dict[str, Any]:
+    def load(self) -> None:
         """
-        Retrieve the last saved checkpoint.
-
-        Returns:
-            Dictionary with 'year' and 'country_code' keys if checkpoint exists,
-            empty dictionary otherwise
+        Load the completion manifest.
+        A single-position checkpoint from older versions is kept as a bound: everything before it is completed.
         """
         try:
-            checkpoint_data = self.get_file(file_path=f"{self.CHECKPOINT_FOLDER}/{self.CHECKPOINT_FILE}")
-            return checkpoint_data
+            manifest = self.get_file(file_path=f"{self.CHECKPOINT_FOLDER}/{self.MANIFEST_FILE}")
+        except FileNotFoundError:
+            manifest = {"completed": {}, "legacy_checkpoint": self.__get_legacy_checkpoint()}
+
+        with self._lock:
+            self._completed = {int(year): set(codes) for year, codes in manifest["completed"].items()}
+            self._legacy_checkpoint = manifest.get("legacy_checkpoint") or {}
+
+        if not self._completed and not self._legacy_checkpoint:
+            self.logger.warning("Checkpoint manifest not found, requesting data from API between start and end year")
+
+    def __get_legacy_checkpoint(self) -> dict[str, Any]:
+        try:
+            return self.get_file(file_path=f"{self.CHECKPOINT_FOLDER}/{self.LEGACY_CHECKPOINT_FILE}")
         except FileNotFoundError:
-            self.logger.warning("Checkpoint file not found, requesting data from API between start and end year")
             return {}
+
+    @property
+    def completed_items(self) -> int:
+        return sum(len(codes) for codes in self._completed.values())
+
+    def is_completed(self, year: int, country_code: str) -> bool:
+        """Check if a (year, country_code) pair was already completed."""
+        with self._lock:
+            if country_code in self._completed.get(year, set()):
+                return True
+        if self._legacy_checkpoint:
+            legacy_year = self._legacy_checkpoint["year"]
+            legacy_country = self._legacy_checkpoint["country_code"]
+            return legacy_year > year or (legacy_year == year and legacy_country >= country_code)
+        return False
+
+    def mark_completed(self, year: int, country_code: str) -> None:
+        """
+        Mark a (year, country_code) pair as completed.
+        The manifest is saved every flush_every_items items or flush_every_seconds seconds.
+        """
+        with self._lock:
+            self._completed.setdefault(year, set()).add(country_code)
+            self._unsaved_items += 1
+            should_flush = (
+                self._unsaved_items >= self.flush_every_items
+                or time.monotonic() - self._last_flush >= self.flush_every_seconds
+            )
+        if should_flush:
+            self.flush()
+
+    def flush(self) -> None:
+        """Save the completion manifest."""
+        with self._lock:
+            manifest = {
+                "completed": {str(year): sorted(codes) for year, codes in sorted(self._completed.items())},
+                "legacy_checkpoint": self._legacy_checkpoint,
+            }
+            self.upload_file(file_path=f"{self.CHECKPOINT_FOLDER}/{self.MANIFEST_FILE}", data=manifest)
+            self._unsaved_items = 0
+            self._last_flush = time.monotonic()
@@ -0,0 +1,48 @@
+import threading
+
+
+class AdaptiveConcurrencyLimiter:
+    """
+    Thread-safe AIMD limit of in-flight requests.
+    Each successful request under the latency target raises the limit additively (by one per limit requests),
+    each error, throttled response or slow request lowers it multiplicatively.
+    """
+
+    def __init__(
+        self,
+        max_in_flight: int,
+        min_in_flight: int = 1,
+        latency_target_seconds: float = 2.0,
+        decrease_factor: float = 0.5,
+    ):
+        """
+        Args:
+            max_in_flight: Upper bound of the limit, also its initial value
+            min_in_flight: Lower bound of the limit
+            latency_target_seconds: Requests slower than this lower the limit
+            decrease_factor: Factor applied to the limit when it is lowered
+        """
+        self.max_in_flight = max(max_in_flight, 1)
+        self.min_in_flight = max(min(min_in_flight, self.max_in_flight), 1)
+        self.latency_target_seconds = latency_target_seconds
+        self.decrease_factor = decrease_factor
+        self.limit = float(self.max_in_flight)
+        self.in_flight = 0
+        self._condition = threading.Condition()
+
+    def acquire(self) -> None:
+        """Block until fewer requests than the current limit are in flight."""
+        with self._condition:
+            while self.in_flight >= int(self.limit):
+                self._condition.wait()
+            self.in_flight += 1
+
+    def release(self, succeeded: bool, latency_seconds: float) -> None:
+        """Release a slot and adapt the limit to the outcome of the request."""
+        with self._condition:
+            self.in_flight -= 1
+            if succeeded and latency_seconds <= self.latency_target_seconds:
+                self.limit = min(self.limit + 1 / self.limit, self.max_in_flight)
+            else:
+                self.limit = max(self.limit * self.decrease_factor, self.min_in_flight)
+            self._condition.notify_all()
@@ -1,22 +1,128 @@
-from typing import Any
+import json
+import threading
+import time
+from collections.abc import Iterator
+from typing import Any, ClassVar
 
 import requests
+from requests.adapters import HTTPAdapter
 
+from src.common.clients.adaptive_limiter import AdaptiveConcurrencyLimiter
+from src.common.clients.json_stream import iter_json_array
+from src.common.clients.rate_limiter import RateLimiter
+from src.common.clients.response_cache import ResponseCache
+from src.common.clients.retry import RetryPolicy
 from src.common.logger import Logger
+from src.common.metrics import metrics
 
 
 class BaseHTTPClient:
-    """Base HTTP client class."""
+    """
+    Base HTTP client class.
+
+    Requests have a timeout and go through a pooled keep-alive session accepting gzip. Failed attempts
+    (connection errors, timeouts, truncated bodies and retryable statuses) are retried by the retry policy, and the
+    number of requests in flight can be adapted to errors and latency by an AIMD concurrency limiter.
+    """
 
     logger = Logger(__name__)
+    STREAM_CHUNK_SIZE = 64 * 1024
+    # ChunkedEncodingError is a body truncated by the server or the network
+    RETRYABLE_ERRORS = (requests.ConnectionError, requests.Timeout, requests.exceptions.ChunkedEncodingError)
+    _sessions: ClassVar[dict[tuple[str, tuple[tuple[str, str], ...], int], requests.Session]] = {}
+    _sessions_lock = threading.Lock()
 
-    def __init__(self, base_url: str, default_headers: dict[str, str] | None = None):
+    def __init__(
+        self,
+        base_url: str,
+        default_headers: dict[str, str] | None = None,
+        rate_limiter: RateLimiter | None = None,
+        response_cache: ResponseCache | None = None,
+        timeout: float | tuple[float, float] | None = None,
+        retry_policy: RetryPolicy | None = None,
+        concurrency_limiter: AdaptiveConcurrencyLimiter | None = None,
+        pool_size: int = 10,
+    ):
+        """
+        Args:
+            base_url: Base URL of the API
+            default_headers: Headers sent with every request
+            rate_limiter: Client-side rate limit of requests
+            response_cache: On-disk cache of responses
+            timeout: Seconds to wait for the server, as (connect, read) or a single value, None to wait forever
+            retry_policy: Retries of failed attempts, a single attempt when not given
+            concurrency_limiter: Adaptive limit of requests in flight
+            pool_size: Keep-alive connections kept per host, at least the number of threads sending requests
+        """
         self.base_url = base_url.rstrip("/")
         self.default_headers = default_headers or {}
-        self.session = requests.Session()
+        self.rate_limiter = rate_limiter
+        self.response_cache = response_cache
+        self.timeout = timeout
+        self.retry_policy = retry_policy or RetryPolicy(max_attempts=1)
+        self.concurrency_limiter = concurrency_limiter
+        self.session = self._get_session(self.base_url, self.default_headers, pool_size)
+
+    @classmethod
+    def _get_session(cls, base_url: str, default_headers: dict[str, str], pool_size: int = 10) -> requests.Session:
+        """
+        Get the session of an API, shared by every client with the same base URL, headers and pool size,
+        so connections are reused across instances (e.g. warm handler invocations).
+        """
+        key = (base_url, tuple(sorted(default_headers.items())), pool_size)
+        with cls._sessions_lock:
+            if key not in cls._sessions:
+                session = requests.Session()
+                session.headers.update({"Accept-Encoding": "gzip", **default_headers})
+                # Retries are made by the client, so the adapter never retries on its own
+                adapter = HTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size, max_retries=0)
+                session.mount("http://", adapter)
+                session.mount("https://", adapter)
+                cls._sessions[key] = session
+            return cls._sessions[key]
+
+    def _send(self, url: str, metric_endpoint: str, stream: bool = False, **kwargs: Any) -> requests.Response:
+        """
+        Send a GET request, retrying connection errors, timeouts, truncated bodies and retryable statuses with the
+        retry policy. The last response is returned whatever its status, the last request error is raised.
+        """
+        attempt = 0
+        while True:
+            if self.rate_limiter:
+                self.rate_limiter.acquire()
+            if self.concurrency_limiter:
+                self.concurrency_limiter.acquire()
+            started = time.monotonic()
+            succeeded = False
+            try:
+                with metrics.span("http_request", endpoint=metric_endpoint):
+                    response = self.session.get(url, timeout=self.timeout, stream=stream, **kwargs)
+                is_retryable = response.status_code in self.retry_policy.retry_statuses
+                succeeded = not is_retryable
+            except self.RETRYABLE_ERRORS as e:
+                if not self.retry_policy.should_retry(attempt):
+                    raise
+                delay = self.retry_policy.delay(attempt)
+                reason = type(e).__name__
+            else:
+                metrics.increment("http_requests_total", endpoint=metric_endpoint, status=response.status_code)
+                if not is_retryable or not self.retry_policy.should_retry(attempt):
+                    return response
+                delay = self.retry_policy.delay(attempt, retry_after=response.headers.get("Retry-After"))
+                reason = str(response.status_code)
+                response.close()
+            finally:
+                # Every attempt gives its slot back, whatever it raised
+                self.__release(succeeded=succeeded, started=started)
 
-        if self.default_headers:
-            self.session.headers.update(self.default_headers)
+            metrics.increment("http_retries_total", endpoint=metric_endpoint, reason=reason)
+            self.logger.warning(f"Retrying {url} in {delay:.2f}s after {reason} (attempt {attempt + 1})")
+            time.sleep(delay)
+            attempt += 1
+
+    def __release(self, succeeded: bool, started: float) -> None:
+        if self.concurrency_limiter:
+            self.concurrency_limiter.release(succeeded=succeeded, latency_seconds=time.monotonic() - started)
 
     def _build_url(self, endpoint: str) -> str:
         return f"{self.base_url}/{endpoint.lstrip('/')}"
@@ -24,12 +130,68 @@ class BaseHTTPClient:
     def get(
         self, endpoint: str, auth: tuple[str, str] | None = None, params: dict[str, Any] | None = None
     ) -> list[dict]:
-        """Get data from the API."""
+        """Get data from the API, serving and revalidating responses from the cache when configured."""
         url = self._build_url(endpoint)
+        metric_endpoint = self._metric_endpoint(endpoint)
+
+        cached = None
+        if self.response_cache:
+            cached = self.response_cache.lookup(self.response_cache.build_key(url, params))
+            if cached and self.response_cache.is_fresh(cached, endpoint):
+                self.response_cache.record_hit()
+                metrics.increment("http_cache_hits_total", endpoint=metric_endpoint)
+                return json.loads(cached.body)
+
         try:
-            response = self.session.get(url, auth=auth, params=params)
+            headers = cached.conditional_headers if cached else None
+            response = self._send(url, metric_endpoint, auth=auth, params=params, headers=headers)
+            metrics.increment("http_response_bytes_total", len(response.content), endpoint=metric_endpoint)
+            if cached and response.status_code == 304:
+                self.response_cache.revalidated(cached.key)
+                return json.loads(cached.body)
+
             response.raise_for_status()
+            if self.response_cache:
+                self.response_cache.store(
+                    key=self.response_cache.build_key(url, params),
+                    body=response.content,
+                    etag=response.headers.get("ETag"),
+                    last_modified=response.headers.get("Last-Modified"),
+                )
             return response.json()
         except requests.RequestException as e:
             self.logger.error(f"Error getting resource from {url}: {e}")
             raise e
+
+    def stream(
+        self, endpoint: str, auth: tuple[str, str] | None = None, params: dict[str, Any] | None = None
+    ) -> Iterator[bytes]:
+        """
+        Get the raw response body from the API as an iterator of byte chunks, bypassing the response cache.
+        The request is sent and its status checked before returning, so HTTP errors are raised here.
+        """
+        url = self._build_url(endpoint)
+        metric_endpoint = self._metric_endpoint(endpoint)
+        try:
+            response = self._send(url, metric_endpoint, stream=True, auth=auth, params=params)
+            response.raise_for_status()
+        except requests.RequestException as e:
+            self.logger.error(f"Error getting resource from {url}: {e}")
+            raise
+        return self._iter_response(response, metric_endpoint=metric_endpoint)
+
+    def stream_records(
+        self, endpoint: str, auth: tuple[str, str] | None = None, params: dict[str, Any] | None = None
+    ) -> Iterator[Any]:
+        """Get a JSON array from the API one element at a time, keeping memory bounded."""
+        return iter_json_array(self.stream(endpoint, auth=auth, params=params))
+
+    def _metric_endpoint(self, endpoint: str) -> str:
+        """First segment of an endpoint (e.g. "data" for "data/all/2020"), to label metrics with low cardinality."""
+        return endpoint.strip("/").split("/")[0]
+
+    def _iter_response(self, response: requests.Response, metric_endpoint: str) -> Iterator[bytes]:
+        with response:
+            for chunk in response.iter_content(chunk_size=self.STREAM_CHUNK_SIZE):
+                metrics.increment("http_response_bytes_total", len(chunk), endpoint=metric_endpoint)
+                yield chunk
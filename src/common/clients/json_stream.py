@@ -0,0 +1,71 @@
+import codecs
+import json
+from collections.abc import Iterable, Iterator
+from itertools import chain
+from typing import Any
+
+WHITESPACE = " \t\n\r"
+
+
+def iter_json_array(chunks: Iterable[bytes]) -> Iterator[Any]:
+    """
+    Incrementally decode a JSON array from byte chunks, yielding one element at a time.
+    Only the undecoded tail of the stream is kept in memory.
+    """
+    decoder = json.JSONDecoder()
+    text_decoder = codecs.getincrementaldecoder("utf-8")()
+    buffer = ""
+    started = False
+
+    for chunk in chain(chunks, [None]):
+        final = chunk is None
+        buffer += text_decoder.decode(b"" if final else chunk, final=final)
+        position = 0
+
+        while True:
+            while position < len(buffer) and buffer[position] in WHITESPACE + ("," if started else ""):
+                position += 1
+            if position == len(buffer):
+                break
+
+            if not started:
+                if buffer[position] != "[":
+                    raise ValueError("Streamed payload is not a JSON array")
+                started = True
+                position += 1
+                continue
+
+            if buffer[position] == "]":
+                return
+
+            try:
+                element, end = decoder.raw_decode(buffer, position)
+            except json.JSONDecodeError:
+                break
+            if not final and (end == len(buffer) or buffer[end] not in WHITESPACE + ",]"):
+                break  # a scalar may continue in the next chunk
+            yield element
+            position = end
+
+        buffer = buffer[position:]
+
+    raise ValueError("Streamed JSON array ended before its closing bracket")
+
+
+def peek_empty_json_array(chunks: Iterator[bytes]) -> tuple[bool, Iterator[bytes]]:
+    """
+    Check if a streamed JSON array is empty without losing the consumed chunks.
+
+    Returns:
+        Tuple with a flag telling if the array is empty and an iterator replaying the whole stream
+    """
+    consumed = []
+    head = ""
+    for chunk in chunks:
+        consumed.append(chunk)
+        head = (head + chunk.decode("utf-8", errors="ignore")).lstrip(WHITESPACE)
+        if head and not head.startswith("["):
+            return False, chain(consumed, chunks)
+        if body := head[1:].lstrip(WHITESPACE):
+            return body.startswith("]"), chain(consumed, chunks)
+    return True, iter(consumed)
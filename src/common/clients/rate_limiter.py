@@ -0,0 +1,24 @@
+import threading
+import time
+
+
+class RateLimiter:
+    """Thread-safe client-side rate limiter spacing calls evenly over time."""
+
+    def __init__(self, requests_per_second: float):
+        self.interval = 1 / requests_per_second if requests_per_second > 0 else 0.0
+        self._lock = threading.Lock()
+        self._next_slot = time.monotonic()
+
+    def acquire(self) -> None:
+        """Block until the caller is allowed to perform the next request."""
+        if not self.interval:
+            return
+
+        with self._lock:
+            now = time.monotonic()
+            slot = max(now, self._next_slot)
+            self._next_slot = slot + self.interval
+
+        if (delay := slot - now) > 0:
+            time.sleep(delay)
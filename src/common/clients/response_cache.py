@@ -0,0 +1,213 @@
+import hashlib
+import json
+import os
+import threading
+import time
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Any
+
+from src.common.file_lock import file_lock
+from src.common.logger import Logger
+
+
+@dataclass
+class CachedResponse:
+    """Class to represent a cached HTTP response body and its validators"""
+
+    key: str
+    body: bytes
+    stored_at: float
+    etag: str | None = None
+    last_modified: str | None = None
+
+    @property
+    def conditional_headers(self) -> dict[str, str]:
+        headers = {}
+        if self.etag:
+            headers["If-None-Match"] = self.etag
+        if self.last_modified:
+            headers["If-Modified-Since"] = self.last_modified
+        return headers
+
+
+class ResponseCache:
+    """
+    On-disk HTTP response cache with per-endpoint TTL, conditional revalidation and LRU eviction.
+    The cache folder can be shared by processes: the entries changed by each one are merged into the stored index.
+    Access times of hits are saved with the next write of the index, at most ACCESS_SAVE_SECONDS after the hit,
+    or by flush.
+    """
+
+    logger = Logger(__name__)
+    INDEX_FILE = "index.json"
+    LOCK_FILE = "index.lock"
+    ACCESS_SAVE_SECONDS = 30
+
+    def __init__(self, cache_path: str, max_bytes: int, ttl_by_endpoint: dict[str, int] | None = None):
+        """
+        Args:
+            cache_path: Folder where response bodies and the cache index are stored
+            max_bytes: Maximum size of all cached bodies, least recently used entries are evicted above it
+            ttl_by_endpoint: Seconds a response stays fresh, by endpoint prefix (longest prefix wins)
+        """
+        self.cache_path = Path(cache_path)
+        self.max_bytes = max_bytes
+        self.ttl_by_endpoint = ttl_by_endpoint or {}
+        self.hits = 0
+        self.misses = 0
+        self.revalidations = 0
+        self._lock = threading.Lock()
+        self.cache_path.mkdir(parents=True, exist_ok=True)
+        self._index: dict[str, dict[str, Any]] = self._load_index()
+        # Keys stored or evicted by this process since the last save of the index
+        self._changed_keys: set[str] = set()
+        self._evicted_keys: set[str] = set()
+        # Access times of the keys hit since the last save, merged without overwriting entries stored by others
+        self._accessed_keys: dict[str, float] = {}
+        self._saved_at = time.monotonic()
+
+    @staticmethod
+    def build_key(url: str, params: dict[str, Any] | None = None) -> str:
+        """Build the cache key of a request from its URL and query parameters."""
+        raw_key = f"{url}?{json.dumps(params or {}, sort_keys=True, default=str)}"
+        return hashlib.sha256(raw_key.encode("utf-8")).hexdigest()
+
+    @property
+    def stats(self) -> dict[str, int]:
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "revalidations": self.revalidations,
+            "entries": len(self._index),
+            "bytes": self._total_bytes(),
+        }
+
+    def ttl(self, endpoint: str) -> int:
+        """Get the TTL of an endpoint, matching the longest configured prefix."""
+        endpoint = endpoint.strip("/")
+        matches = [prefix for prefix in self.ttl_by_endpoint if endpoint.startswith(prefix.strip("/"))]
+        if not matches:
+            return 0
+        return self.ttl_by_endpoint[max(matches, key=len)]
+
+    def lookup(self, key: str) -> CachedResponse | None:
+        """Get a cached response, or None if the key is not cached."""
+        with self._lock:
+            entry = self._index.get(key)
+            if entry is None:
+                return None
+            body_path = self.cache_path / entry["file"]
+            if not body_path.exists():
+                self._index.pop(key)
+                return None
+            entry["last_access"] = self._accessed_keys[key] = time.time()
+            cached = CachedResponse(
+                key=key,
+                body=body_path.read_bytes(),
+                stored_at=entry["stored_at"],
+                etag=entry.get("etag"),
+                last_modified=entry.get("last_modified"),
+            )
+            if time.monotonic() - self._saved_at >= self.ACCESS_SAVE_SECONDS:
+                self._save_index()
+            return cached
+
+    def flush(self) -> None:
+        """Save the access times and entries not saved yet, e.g. at the end of a run."""
+        with self._lock:
+            if self._accessed_keys or self._changed_keys or self._evicted_keys:
+                self._save_index()
+
+    def is_fresh(self, cached: CachedResponse, endpoint: str) -> bool:
+        """Check if a cached response can be served without contacting the server."""
+        return time.time() - cached.stored_at < self.ttl(endpoint)
+
+    def record_hit(self) -> None:
+        with self._lock:
+            self.hits += 1
+
+    def revalidated(self, key: str) -> None:
+        """Mark a cached response as fresh again after the server answered 304 Not Modified."""
+        with self._lock:
+            self.revalidations += 1
+            if entry := self._index.get(key):
+                entry["stored_at"] = time.time()
+                self._changed_keys.add(key)
+                self._save_index()
+
+    def store(self, key: str, body: bytes, etag: str | None = None, last_modified: str | None = None) -> None:
+        """Store a response body, evicting least recently used entries above the size cap."""
+        with self._lock:
+            self.misses += 1
+            if len(body) > self.max_bytes:
+                return
+
+            file_name = f"{key}.body"
+            temp_path = self.cache_path / f"{file_name}.{os.getpid()}.tmp"
+            temp_path.write_bytes(body)
+            os.replace(temp_path, self.cache_path / file_name)
+
+            now = time.time()
+            self._index[key] = {
+                "file": file_name,
+                "size": len(body),
+                "stored_at": now,
+                "last_access": now,
+                "etag": etag,
+                "last_modified": last_modified,
+            }
+            self._changed_keys.add(key)
+            self._evicted_keys.discard(key)
+            self._evict()
+            self._save_index()
+
+    def _total_bytes(self) -> int:
+        return sum(entry["size"] for entry in self._index.values())
+
+    def _evict(self) -> None:
+        total_bytes = self._total_bytes()
+        for key, entry in sorted(self._index.items(), key=lambda item: item[1]["last_access"]):
+            if total_bytes <= self.max_bytes:
+                break
+            (self.cache_path / entry["file"]).unlink(missing_ok=True)
+            self._index.pop(key)
+            self._changed_keys.discard(key)
+            self._evicted_keys.add(key)
+            total_bytes -= entry["size"]
+            self.logger.info(f"Evicted cached response {key}")
+
+    def _load_index(self) -> dict[str, dict[str, Any]]:
+        index_path = self.cache_path / self.INDEX_FILE
+        if not index_path.exists():
+            return {}
+        try:
+            with index_path.open("r", encoding="utf-8") as f:
+                return json.load(f)
+        except json.JSONDecodeError:
+            self.logger.warning(f"Cache index {index_path} is corrupted, starting with an empty cache")
+            return {}
+
+    def _save_index(self) -> None:
+        """
+        Merge the entries changed by this process into the stored index, under a lock file, and adopt the entries
+        stored by other processes. Call with the lock held.
+        """
+        index_path = self.cache_path / self.INDEX_FILE
+        temp_path = index_path.with_name(f"{index_path.name}.{os.getpid()}.tmp")
+        with file_lock(self.cache_path / self.LOCK_FILE):
+            index = self._load_index()
+            for key in self._evicted_keys:
+                index.pop(key, None)
+            index.update({key: self._index[key] for key in self._changed_keys})
+            for key, last_access in self._accessed_keys.items():
+                if key in index:
+                    index[key]["last_access"] = max(index[key]["last_access"], last_access)
+            with temp_path.open("w", encoding="utf-8") as f:
+                json.dump(index, f)
+            os.replace(temp_path, index_path)
+        self._index = index
+        self._changed_keys.clear()
+        self._evicted_keys.clear()
+        self._accessed_keys.clear()
+        self._saved_at = time.monotonic()
@@ -0,0 +1,42 @@
+import random
+import time
+from dataclasses import dataclass
+from email.utils import parsedate_to_datetime
+
+
+@dataclass
+class RetryPolicy:
+    """
+    Retries of HTTP requests with a jittered exponential backoff.
+    The delay before retry n is drawn uniformly between 0 and backoff_seconds * 2**n ("full jitter"),
+    capped at max_backoff_seconds, unless the response asks for a delay with a Retry-After header.
+    """
+
+    max_attempts: int = 4
+    backoff_seconds: float = 0.5
+    max_backoff_seconds: float = 30.0
+    retry_statuses: frozenset[int] = frozenset({429, 500, 502, 503, 504})
+
+    def should_retry(self, attempt: int) -> bool:
+        """Check if a failed attempt (counted from 0) can be retried."""
+        return attempt + 1 < self.max_attempts
+
+    def delay(self, attempt: int, retry_after: str | None = None) -> float:
+        """Seconds to wait before retrying a failed attempt, honouring a Retry-After header when given."""
+        if (retry_after_seconds := parse_retry_after(retry_after)) is not None:
+            return min(retry_after_seconds, self.max_backoff_seconds)
+        return random.uniform(0, min(self.backoff_seconds * 2**attempt, self.max_backoff_seconds))
+
+
+def parse_retry_after(value: str | None) -> float | None:
+    """Parse a Retry-After header, given in seconds or as an HTTP date. None when missing or invalid."""
+    if not value:
+        return None
+    try:
+        return max(float(value), 0.0)
+    except ValueError:
+        pass
+    try:
+        return max(parsedate_to_datetime(value).timestamp() - time.time(), 0.0)
+    except (TypeError, ValueError):
+        return None
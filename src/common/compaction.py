@@ -0,0 +1,174 @@
+import json
+import os
+import time
+from contextlib import ExitStack
+from pathlib import Path
+from typing import Any
+
+from src.common.file_lock import file_lock
+from src.common.repositories.aws.raw_format import RAW_EXTENSIONS, canonical_hash, read_raw, strip_raw_extension
+from src.common.repositories.aws.s3 import S3Repository
+
+COMPACTED_FOLDER = "compacted"
+COMPACTION_MANIFEST_FILE = "manifest.json"
+
+
+def source_fingerprint(path: str | Path) -> dict[str, int]:
+    stat = os.stat(path)
+    return {"size": stat.st_size, "mtime_ns": stat.st_mtime_ns}
+
+
+def read_compaction_manifest(folder_path: str) -> dict[str, Any] | None:
+    """Read the compaction manifest of a raw folder, None if the folder was never compacted."""
+    try:
+        with open(os.path.join(folder_path, COMPACTED_FOLDER, COMPACTION_MANIFEST_FILE), "rb") as f:
+            return json.load(f)
+    except FileNotFoundError:
+        return None
+
+
+def apply_compaction(folder_path: str, json_files: list[str]) -> list[str]:
+    """
+    Replace the raw files of a folder covered by its compaction with the compacted file.
+    Files written after the compaction are kept, so they are read alongside the compacted file.
+
+    Args:
+        folder_path: Raw folder, e.g. RAW_PATH/data/{year}
+        json_files: Raw files listed in the folder
+
+    Returns:
+        Files to read: the compacted file first, then the files not covered by it
+    """
+    manifest = read_compaction_manifest(folder_path)
+    if manifest is None:
+        return json_files
+    covered = {strip_raw_extension(source["name"]): source for source in manifest["sources"]}
+    files = [os.path.join(folder_path, COMPACTED_FOLDER, manifest["file"])]
+    for json_file in json_files:
+        source = covered.get(strip_raw_extension(os.path.basename(json_file)))
+        if source is None or source_fingerprint(json_file) != source["fingerprint"]:
+            files.append(json_file)
+    return files
+
+
+class RawCompaction(S3Repository):
+    """
+    Compaction of the small raw files of a folder into one file of records, like an "all" payload.
+
+    The compacted file is written under a name derived from its content and the manifest, written after it,
+    points to it and lists the sources (name, fingerprint, records and content hash) for lineage.
+    Sources are deleted only if unchanged since they were read, so files written concurrently are kept
+    and compacted by the next run. Compactions of a folder are serialized by a lock file next to its sources.
+    """
+
+    LOCK_FILE = ".compaction.lock"
+
+    def __init__(self, bucket_name: str, raw_format: str = "ndjson-gzip", excluded_stems: set[str] | None = None):
+        """
+        Args:
+            bucket_name: Bucket of the raw files
+            raw_format: Format of the compacted files, NDJSON formats being the compact ones
+            excluded_stems: Stems of files never compacted, e.g. {"all"} for payloads already consolidated
+        """
+        super().__init__(bucket_name, raw_format=raw_format)
+        self.excluded_stems = excluded_stems or set()
+
+    def list_sources(self, folder: str) -> list[Path]:
+        """List the raw files of a folder which can be compacted."""
+        folder_path = Path(self.bucket_name) / folder
+        sources = {
+            path
+            for extension in RAW_EXTENSIONS
+            for path in folder_path.glob(f"*{extension}")
+            if strip_raw_extension(path.name) not in self.excluded_stems
+        }
+        return sorted(sources)
+
+    def compact(self, folder: str, min_files: int = 2) -> dict[str, Any] | None:
+        """
+        Compact the raw files of a folder (inside the bucket) with the records of its previous compaction.
+        A source compacted again, in any raw format, replaces its previous records.
+
+        Args:
+            folder: Folder inside the bucket, e.g. data/2010
+            min_files: Minimum number of sources to compact a folder never compacted
+
+        Returns:
+            Manifest of the compaction, None if there was nothing to compact or the folder is locked
+        """
+        # Checked before taking the lock too, so folders with nothing to compact are left untouched
+        if not self.__has_work(folder=folder, min_files=min_files):
+            return None
+        with ExitStack() as stack:
+            try:
+                stack.enter_context(file_lock(Path(self.bucket_name) / folder / self.LOCK_FILE, wait_seconds=0))
+            except TimeoutError:
+                self.logger.warning(f"Compaction of {folder} already running, skipping it")
+                return None
+            if not self.__has_work(folder=folder, min_files=min_files):
+                return None
+            manifest = read_compaction_manifest(str(Path(self.bucket_name) / folder))
+            return self.__compact(folder=folder, manifest=manifest, sources=self.list_sources(folder))
+
+    def __has_work(self, folder: str, min_files: int) -> bool:
+        sources = self.list_sources(folder)
+        if not sources:
+            return False
+        return len(sources) >= min_files or read_compaction_manifest(str(Path(self.bucket_name) / folder)) is not None
+
+    def __compact(self, folder: str, manifest: dict[str, Any] | None, sources: list[Path]) -> dict[str, Any]:
+        slices, compacted_sources = [], []
+        for source in sources:
+            fingerprint = source_fingerprint(source)
+            data = read_raw(source)
+            if source_fingerprint(source) != fingerprint:
+                self.logger.warning(f"{source} changed while compacted, leaving it to the next compaction")
+                continue
+            entry = {
+                "name": source.name,
+                "fingerprint": fingerprint,
+                "records": len(data),
+                "content_hash": canonical_hash(data),
+            }
+            slices.append((entry, data))
+            compacted_sources.append(source)
+
+        new_stems = {strip_raw_extension(entry["name"]) for entry, _ in slices}
+        if manifest is not None:
+            previous_records = read_raw(Path(self.bucket_name) / folder / COMPACTED_FOLDER / manifest["file"])
+            offset = 0
+            for entry in manifest["sources"]:
+                if strip_raw_extension(entry["name"]) not in new_stems:
+                    slices.append((entry, previous_records[offset : offset + entry["records"]]))
+                offset += entry["records"]
+        # Sources are kept in name order, so compacting the same sources gives the same file
+        slices.sort(key=lambda item: item[0]["name"])
+        records = [record for _, data in slices for record in data]
+        entries = [entry for entry, _ in slices]
+
+        content_hash = canonical_hash(records)
+        stored_path = self.upload_file(
+            file_path=f"{folder}/{COMPACTED_FOLDER}/{Path(folder).name}-{content_hash[:16]}.json", data=records
+        )
+        new_manifest = {
+            "file": Path(stored_path).name,
+            "records": len(records),
+            "content_hash": content_hash,
+            "compacted_at": time.time(),
+            "sources": entries,
+        }
+        self.upload_file(file_path=f"{folder}/{COMPACTED_FOLDER}/{COMPACTION_MANIFEST_FILE}", data=new_manifest)
+        if manifest is not None and manifest["file"] != new_manifest["file"]:
+            (Path(self.bucket_name) / folder / COMPACTED_FOLDER / manifest["file"]).unlink(missing_ok=True)
+
+        entries_by_name = {entry["name"]: entry for entry in entries}
+        for source in compacted_sources:
+            entry = entries_by_name[source.name]
+            # A source rewritten since it was read is newer than its compacted records, so it is kept
+            if source_fingerprint(source) == entry["fingerprint"]:
+                source.unlink()
+                self.record_compacted(stored_path=f"{folder}/{source.name}", content_hash=entry["content_hash"])
+        self.flush_hash_indexes()
+
+        self.logger.info(f"Compacted {len(compacted_sources)} files of {folder} into {stored_path}")
+        return new_manifest
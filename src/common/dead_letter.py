@@ -0,0 +1,61 @@
+import threading
+import time
+
+from src.common.repositories.aws.s3 import S3Repository
+
+
+class DeadLetterStore(S3Repository):
+    """
+    Dead-letter store of the (year, country_code) pairs whose fetch or write failed, as structured records,
+    so they can be replayed without walking every year and country again.
+    """
+
+    DEAD_LETTER_FILE = "dead_letters/index.json"
+
+    def __init__(self, bucket_name: str):
+        """
+        Args:
+            bucket_name: Bucket where the dead letters are stored
+        """
+        super().__init__(bucket_name, raw_format="json-min")
+        self._lock = threading.Lock()
+        self._records: dict[tuple[int, str], dict] = {}
+
+    def load(self) -> None:
+        try:
+            records = self.get_file(file_path=self.DEAD_LETTER_FILE)
+        except FileNotFoundError:
+            records = []
+        with self._lock:
+            self._records = {(record["year"], record["country_code"]): record for record in records}
+
+    def flush(self) -> None:
+        """Save the dead letters."""
+        with self._lock:
+            records = [self._records[key] for key in sorted(self._records)]
+            self.upload_file(file_path=self.DEAD_LETTER_FILE, data=records)
+
+    def record(self, year: int, country_code: str, endpoint: str, error_class: str, error: str) -> None:
+        """Record a failure of a pair, counting the attempts made since its first failure."""
+        now = time.time()
+        with self._lock:
+            previous = self._records.get((year, country_code), {})
+            self._records[(year, country_code)] = {
+                "year": year,
+                "country_code": country_code,
+                "endpoint": endpoint,
+                "error_class": error_class,
+                "error": error,
+                "attempts": previous.get("attempts", 0) + 1,
+                "first_failed_at": previous.get("first_failed_at", now),
+                "last_failed_at": now,
+            }
+
+    def remove(self, year: int, country_code: str) -> None:
+        """Remove a pair which succeeded."""
+        with self._lock:
+            self._records.pop((year, country_code), None)
+
+    def records(self) -> list[dict]:
+        with self._lock:
+            return [dict(self._records[key]) for key in sorted(self._records)]
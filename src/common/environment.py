@@ -1,13 +1,87 @@
 import os
+from collections.abc import Callable
 from datetime import datetime
+from typing import Any
+
+
+def as_bool(value: str) -> bool:
+    return str(value).lower() == "true"
+
+
+class Setting:
+    """
+    Setting read from the environment variable of the same name when first accessed, not at import time.
+    The value is then kept on the Environment instance, so each instance is a snapshot of the environment.
+    """
+
+    def __init__(self, cast: Callable[[Any], Any], default: Any):
+        self.cast = cast
+        self.default = default
+
+    def __set_name__(self, owner: type, name: str) -> None:
+        self.name = name
+
+    def __get__(self, instance: Any, owner: type) -> Any:
+        default = self.default() if callable(self.default) else self.default
+        value = self.cast(os.getenv(self.name, default))
+        if instance is not None:
+            instance.__dict__[self.name] = value
+        return value
 
 
 class Environment:
-    API_USERNAME = os.getenv("API_USERNAME", "")
-    API_KEY = os.getenv("API_KEY", "")
-    UPDATE_COUNTRIES = os.getenv("UPDATE_COUNTRIES", "False").lower() == "true"
-    START_YEAR = int(os.getenv("START_YEAR", 2010))
-    END_YEAR = int(os.getenv("END_YEAR", datetime.now().year))
-    CHECKPOINT = os.getenv("CHECKPOINT", "True").lower() == "true"
-    RAW_PATH = os.getenv("RAW_PATH", "raw")
-    DATABASE_PATH = os.getenv("DATABASE_PATH", "database.db")
+    API_USERNAME = Setting(str, default="")
+    API_KEY = Setting(str, default="")
+    API_BASE_URL = Setting(str, default="https://api.footprintnetwork.org/v1")
+    UPDATE_COUNTRIES = Setting(as_bool, default=False)
+    START_YEAR = Setting(int, default=2010)
+    END_YEAR = Setting(int, default=lambda: datetime.now().year)
+    CHECKPOINT = Setting(as_bool, default=True)
+    CHECKPOINT_FLUSH_ITEMS = Setting(int, default=50)
+    CHECKPOINT_FLUSH_SECONDS = Setting(float, default=30)
+    RAW_PATH = Setting(str, default="raw")
+    DATABASE_PATH = Setting(str, default="database.db")
+    TRUSTED_READER = Setting(str, default="pandas")
+    TRUSTED_WORKERS = Setting(int, default=1)
+    TRUSTED_MAX_IN_FLIGHT = Setting(int, default=4)
+    COMPACT_DTYPES = Setting(as_bool, default=False)
+    COMPACT_FLOAT32 = Setting(as_bool, default=False)
+    TRUSTED_MERGE_BATCH_ROWS = Setting(int, default=1_000_000)
+    TRUSTED_SINK = Setting(str, default="duckdb")
+    TRUSTED_AGGREGATES = Setting(as_bool, default=True)
+    TRUSTED_VALIDATION = Setting(as_bool, default=True)
+    PARQUET_PATH = Setting(str, default="trusted")
+    PARQUET_ROW_GROUP_SIZE = Setting(int, default=122_880)
+    METRICS_PROMETHEUS_PATH = Setting(str, default="")
+    FUSED_TRUSTED = Setting(as_bool, default=False)
+    FUSED_BATCH_ROWS = Setting(int, default=50_000)
+    FUSED_BATCH_SECONDS = Setting(float, default=5)
+    AVAILABILITY_INDEX = Setting(as_bool, default=False)
+    AVAILABILITY_EMPTY_TTL_SECONDS = Setting(float, default=7 * 24 * 60 * 60)
+    AVAILABILITY_ERROR_TTL_SECONDS = Setting(float, default=60 * 60)
+    AVAILABILITY_YEARS_TTL_SECONDS = Setting(float, default=24 * 60 * 60)
+    MAX_WORKERS = Setting(int, default=1)
+    REQUESTS_PER_SECOND = Setting(float, default=0)
+    HTTP_CONNECT_TIMEOUT_SECONDS = Setting(float, default=10)
+    HTTP_READ_TIMEOUT_SECONDS = Setting(float, default=60)
+    HTTP_MAX_ATTEMPTS = Setting(int, default=4)
+    HTTP_BACKOFF_SECONDS = Setting(float, default=0.5)
+    HTTP_MAX_BACKOFF_SECONDS = Setting(float, default=30)
+    HTTP_POOL_SIZE = Setting(int, default=16)
+    HTTP_ADAPTIVE_CONCURRENCY = Setting(as_bool, default=False)
+    HTTP_MAX_IN_FLIGHT = Setting(int, default=8)
+    HTTP_LATENCY_TARGET_SECONDS = Setting(float, default=2)
+    HTTP_CACHE_PATH = Setting(str, default="")
+    HTTP_CACHE_MAX_BYTES = Setting(int, default=512 * 1024 * 1024)
+    STREAM_ALL_COUNTRIES = Setting(as_bool, default=False)
+    RAW_FORMAT = Setting(str, default="json")
+    SKIP_UNCHANGED_RAW = Setting(as_bool, default=True)
+    WRITE_BEHIND_WORKERS = Setting(int, default=0)
+    WRITE_BEHIND_MAX_PENDING = Setting(int, default=100)
+    REPLAY_WORKERS = Setting(int, default=8)
+    COMPACTION_FORMAT = Setting(str, default="ndjson-gzip")
+    COMPACTION_MIN_FILES = Setting(int, default=2)
+    WORK_QUEUE_PATH = Setting(str, default="work_queue.db")
+    WORK_QUEUE_WORKERS = Setting(int, default=4)
+    WORK_QUEUE_VISIBILITY_SECONDS = Setting(float, default=5 * 60)
+    WORK_QUEUE_MAX_RECEIVES = Setting(int, default=5)
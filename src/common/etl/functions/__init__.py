@@ -1,4 +1,6 @@
+from .apply_schema import apply_schema
 from .enforce_types import enforce_types
 from .range_years import range_years
+from .validate_schema import validate_schema
 
-all = [enforce_types, range_years]
+all = [apply_schema, enforce_types, range_years, validate_schema]
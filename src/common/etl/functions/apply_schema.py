@@ -0,0 +1,14 @@
+from typing import TYPE_CHECKING
+
+from src.common.etl.functions.enforce_types import enforce_types
+
+if TYPE_CHECKING:  # pandas is imported by the caller, so importing this package stays light for the raw stage
+    import pandas as pd
+
+    from src.common.schema.base import BaseSchema
+
+
+def apply_schema(df: "pd.DataFrame", schema: "BaseSchema") -> "pd.DataFrame":
+    """Rename, select and enforce the types of the columns of a schema on a DataFrame, casting in one pass."""
+    renamed_df = df.rename(columns=schema.rename_columns)
+    return enforce_types(df=renamed_df[schema.select_columns], columns=schema.pandas_types)
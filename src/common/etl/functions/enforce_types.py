@@ -1,10 +1,23 @@
-import pandas as pd
+from typing import TYPE_CHECKING
 
+if TYPE_CHECKING:
+    import pandas as pd
 
-def enforce_types(df: pd.DataFrame, columns: dict) -> pd.DataFrame:
-    """Enforce types on a DataFrame."""
 
-    for column, data_type in columns.items():
-        if column in df.columns:
-            df[column] = df[column].astype(data_type)
-    return df
+def enforce_types(df: "pd.DataFrame", columns: dict) -> "pd.DataFrame":
+    """
+    Enforce types on a DataFrame, casting every column in a single pass.
+    Values outside the categories of a categorical type raise instead of silently becoming null.
+    """
+    import pandas as pd
+
+    types = {column: data_type for column, data_type in columns.items() if column in df.columns}
+    enforced_df = df.astype(types)
+    for column, data_type in types.items():
+        if isinstance(data_type, pd.CategoricalDtype):
+            unknown_values = enforced_df[column].isna() & df[column].notna()
+            if unknown_values.any():
+                raise ValueError(
+                    f"Unknown values for column {column}: {sorted(df.loc[unknown_values, column].unique())}"
+                )
+    return enforced_df
@@ -0,0 +1,65 @@
+from typing import TYPE_CHECKING
+
+from src.common.etl.functions.enforce_types import enforce_types
+
+if TYPE_CHECKING:  # pandas is imported by the caller, so importing this package stays light for the raw stage
+    import pandas as pd
+
+    from src.common.schema.base import BaseSchema
+
+
+def validate_schema(df: "pd.DataFrame", schema: "BaseSchema") -> tuple["pd.DataFrame", "pd.DataFrame"]:
+    """
+    Rename and select the columns of a schema, evaluate its rules with vectorized column operations and enforce
+    the types of the valid rows only, so a bad row is rejected instead of failing the cast of the whole batch.
+    Of the valid rows sharing merge keys, the last one is kept and the others are rejected as duplicate_key.
+
+    Returns:
+        Tuple with the valid rows, typed, and the rejected rows, as text with the first rule they break
+        and their raw file when df has a source_file column
+    """
+    import numpy as np
+    import pandas as pd
+
+    from src.common.schema.base import REJECT_RULE_COLUMN, REJECT_SOURCE_COLUMN
+
+    sources = df[REJECT_SOURCE_COLUMN].to_numpy() if REJECT_SOURCE_COLUMN in df.columns else None
+    df = df.rename(columns=schema.rename_columns)[schema.select_columns].reset_index(drop=True)
+    rules = np.full(len(df), None, dtype=object)
+
+    def reject(mask: "pd.Series", rule: str) -> None:
+        # A row keeps the first rule it breaks
+        mask = mask.to_numpy(dtype=bool, na_value=False) & pd.isna(rules)
+        rules[mask] = rule
+
+    for column in schema.columns:
+        values = df[column.name]
+        missing = values.isna()
+        if column.required:
+            reject(missing, "not_null")
+        if column.accepted_values:
+            reject(~missing & ~values.isin(column.accepted_values), "allowed_values")
+        column_type = schema.enforce_types[column.name]
+        if column_type.startswith(("int", "float")):
+            numbers = pd.to_numeric(values, errors="coerce")
+            invalid = numbers.isna()
+            if column_type.startswith("int"):
+                bounds = np.iinfo(column_type)
+                invalid |= (numbers % 1 != 0) | (numbers < bounds.min) | (numbers > bounds.max)
+            reject(~missing & invalid, "invalid_type")
+            if column.min_value is not None:
+                reject(numbers < column.min_value, "range")
+            if column.max_value is not None:
+                reject(numbers > column.max_value, "range")
+
+    valid = pd.isna(rules)
+    valid_df = enforce_types(df=df[valid], columns=schema.pandas_types)
+    duplicated = valid_df.duplicated(subset=schema.merge_key_columns, keep="last").to_numpy()
+    rules[np.flatnonzero(valid)[duplicated]] = "duplicate_key"
+
+    rejected = ~pd.isna(rules)
+    rejected_df = df[rejected].astype("string")
+    rejected_df[REJECT_RULE_COLUMN] = rules[rejected]
+    if sources is not None:
+        rejected_df[REJECT_SOURCE_COLUMN] = sources[rejected]
+    return valid_df[~duplicated], rejected_df
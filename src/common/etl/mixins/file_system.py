@@ -1,8 +1,12 @@
 import glob
+import hashlib
 import os
 
 import pandas as pd
 
+from src.common.metrics import metrics
+from src.common.repositories.aws.raw_format import RAW_EXTENSIONS, is_ndjson
+
 
 class FileSystemETLMixin:
     """Mixin for file system operations."""
@@ -12,9 +16,27 @@ class FileSystemETLMixin:
         return os.path.exists(file_path)
 
     def list_json_files(self, folder_path: str) -> list[str]:
-        """List all JSON files in a folder."""
-        pattern = os.path.join(folder_path, "*.json")
-        return glob.glob(pattern)
+        """List all JSON and NDJSON (optionally compressed) files in a folder, with normalized paths."""
+        json_files = []
+        for extension in RAW_EXTENSIONS:
+            json_files.extend(glob.glob(os.path.join(folder_path, f"*{extension}")))
+        return sorted(os.path.normpath(json_file) for json_file in json_files)
+
+    def file_fingerprint(self, file_path: str) -> dict[str, str | int | float]:
+        """
+        Get the path, size and modification time of a file. The path is normalized, so a file reached through
+        ./raw or raw has a single fingerprint in the processed files manifest.
+        """
+        stat = os.stat(file_path)
+        return {"path": os.path.normpath(file_path), "size": stat.st_size, "mtime": stat.st_mtime}
+
+    def file_content_hash(self, file_path: str) -> str:
+        """Get the SHA-256 hash of a file content, reading it in chunks."""
+        content_hash = hashlib.sha256()
+        with open(file_path, "rb") as f:
+            for chunk in iter(lambda: f.read(1024 * 1024), b""):
+                content_hash.update(chunk)
+        return content_hash.hexdigest()
 
     def read_json_with_pandas(self, file_path: str) -> pd.DataFrame:
         """Read JSON files in a folder into a Pandas DataFrame."""
@@ -23,9 +45,27 @@ class FileSystemETLMixin:
         if not json_files:
             raise FileNotFoundError(f"File not found: {file_path}")
 
+        return self.read_json_files_with_pandas(json_files)
+
+    def read_json_files_with_pandas(self, json_files: list[str], source_column: str | None = None) -> pd.DataFrame:
+        """
+        Read a list of JSON files into a Pandas DataFrame.
+
+        Args:
+            json_files: Files to read
+            source_column: Column receiving the normalized path of the file of each row, none when not given
+        """
+
         df_list = []
-        for json_file in json_files:
-            df = pd.read_json(json_file)
-            df_list.append(df)
+        with metrics.span("read_json"):
+            for json_file in json_files:
+                df = pd.read_json(json_file, lines=is_ndjson(json_file), compression="infer")
+                if source_column:
+                    df[source_column] = os.path.normpath(json_file)
+                metrics.increment("read_json_bytes_total", os.path.getsize(json_file))
+                df_list.append(df)
+            df = pd.concat(df_list)
 
-        return pd.concat(df_list)
+        metrics.increment("read_json_files_total", len(json_files))
+        metrics.increment("read_json_rows_total", len(df))
+        return df
@@ -0,0 +1,40 @@
+import os
+import time
+from collections.abc import Iterator
+from contextlib import contextmanager
+from pathlib import Path
+
+
+@contextmanager
+def file_lock(lock_path: str | Path, wait_seconds: float = 30.0, stale_seconds: float = 10 * 60) -> Iterator[None]:
+    """
+    Lock shared by processes through a lock file created exclusively, e.g. around the read-merge-write
+    of an index written by several workers. A lock older than stale_seconds, left by a dead process, is taken over.
+
+    Args:
+        lock_path: Lock file, created with its folder
+        wait_seconds: Seconds to wait for the lock, 0 to try only once
+        stale_seconds: Age of a lock file considered stale
+
+    Raises:
+        TimeoutError: The lock is still held by another process after wait_seconds
+    """
+    lock_path = Path(lock_path)
+    lock_path.parent.mkdir(parents=True, exist_ok=True)
+    deadline = time.monotonic() + wait_seconds
+    while True:
+        try:
+            if lock_path.exists() and time.time() - lock_path.stat().st_mtime > stale_seconds:
+                lock_path.unlink(missing_ok=True)
+            os.close(os.open(lock_path, os.O_CREAT | os.O_EXCL | os.O_WRONLY))
+            break
+        except FileExistsError:
+            if time.monotonic() >= deadline:
+                raise TimeoutError(f"Lock {lock_path} is held by another process")
+            time.sleep(0.05)
+        except FileNotFoundError:
+            continue  # the stale lock was removed by another process in between
+    try:
+        yield
+    finally:
+        lock_path.unlink(missing_ok=True)
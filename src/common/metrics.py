@@ -0,0 +1,189 @@
+import bisect
+import os
+import threading
+import time
+from collections.abc import Iterator
+from contextlib import contextmanager
+from dataclasses import dataclass, field
+from datetime import datetime
+from pathlib import Path
+from typing import Any
+
+from src.common.logger import Logger
+
+# Upper bounds of duration histograms, in seconds
+SECONDS_BUCKETS = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+
+Labels = tuple[tuple[str, str], ...]
+
+
+@dataclass
+class Histogram:
+    """Distribution of observed values, with cumulative bucket counts as in Prometheus."""
+
+    buckets: tuple[float, ...]
+    bucket_counts: list[int] = field(default_factory=list)
+    count: int = 0
+    total: float = 0.0
+    min: float = float("inf")
+    max: float = float("-inf")
+
+    def __post_init__(self):
+        self.bucket_counts = [0] * len(self.buckets)
+
+    def observe(self, value: float) -> None:
+        index = bisect.bisect_left(self.buckets, value)
+        if index < len(self.buckets):
+            self.bucket_counts[index] += 1
+        self.count += 1
+        self.total += value
+        self.min = min(self.min, value)
+        self.max = max(self.max, value)
+
+    def summary(self) -> dict[str, float]:
+        return {
+            "count": self.count,
+            "sum": round(self.total, 6),
+            "mean": round(self.total / self.count, 6) if self.count else 0.0,
+            "min": round(self.min, 6) if self.count else 0.0,
+            "max": round(self.max, 6) if self.count else 0.0,
+        }
+
+
+class Metrics:
+    """
+    Registry of counters, histograms and timing spans of a run, shared by every component of the process.
+    Metrics are identified by name and labels; keep label values low-cardinality (e.g. endpoint, not URL).
+    """
+
+    logger = Logger(__name__)
+    PREFIX = "carbon_footprint"
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._counters: dict[tuple[str, Labels], float] = {}
+        self._histograms: dict[tuple[str, Labels], Histogram] = {}
+        self._started_at = time.time()
+
+    def reset(self) -> None:
+        """Clear every metric and restart the run clock."""
+        with self._lock:
+            self._counters.clear()
+            self._histograms.clear()
+            self._started_at = time.time()
+
+    def increment(self, name: str, value: float = 1, **labels: Any) -> None:
+        """Add a value to a counter."""
+        key = (name, self.__labels(labels))
+        with self._lock:
+            self._counters[key] = self._counters.get(key, 0) + value
+
+    def observe(self, name: str, value: float, buckets: tuple[float, ...] = SECONDS_BUCKETS, **labels: Any) -> None:
+        """Record a value in a histogram, created with the given buckets on its first observation."""
+        key = (name, self.__labels(labels))
+        with self._lock:
+            histogram = self._histograms.setdefault(key, Histogram(buckets=buckets))
+            histogram.observe(value)
+
+    @contextmanager
+    def span(self, name: str, **labels: Any) -> Iterator[None]:
+        """
+        Time a block into the {name}_seconds histogram.
+        Failed blocks are also counted in {name}_errors_total before the exception propagates.
+        """
+        start = time.perf_counter()
+        try:
+            yield
+        except Exception:
+            self.increment(f"{name}_errors_total", **labels)
+            raise
+        finally:
+            self.observe(f"{name}_seconds", time.perf_counter() - start, **labels)
+
+    def summary(self) -> dict[str, Any]:
+        """Counters and histogram summaries of the run, keyed by name and labels."""
+        with self._lock:
+            counters = {self.__series(name, labels): value for (name, labels), value in sorted(self._counters.items())}
+            histograms = {
+                self.__series(name, labels): histogram.summary()
+                for (name, labels), histogram in sorted(self._histograms.items())
+            }
+        return {
+            "started_at": datetime.fromtimestamp(self._started_at).isoformat(),
+            "duration_seconds": round(time.time() - self._started_at, 6),
+            "counters": counters,
+            "histograms": histograms,
+        }
+
+    def to_prometheus(self) -> str:
+        """Render the metrics in the Prometheus text exposition format."""
+        lines = []
+        with self._lock:
+            for name in sorted({name for name, _ in self._counters}):
+                lines.append(f"# TYPE {self.PREFIX}_{name} counter")
+                for (series_name, labels), value in sorted(self._counters.items()):
+                    if series_name == name:
+                        lines.append(f"{self.PREFIX}_{self.__series(name, labels)} {value}")
+
+            for name in sorted({name for name, _ in self._histograms}):
+                lines.append(f"# TYPE {self.PREFIX}_{name} histogram")
+                for (series_name, labels), histogram in sorted(self._histograms.items()):
+                    if series_name != name:
+                        continue
+                    cumulative = 0
+                    for bound, bucket_count in zip(histogram.buckets, histogram.bucket_counts):
+                        cumulative += bucket_count
+                        bucket_labels = labels + (("le", str(bound)),)
+                        lines.append(f"{self.PREFIX}_{self.__series(f'{name}_bucket', bucket_labels)} {cumulative}")
+                    bucket_labels = labels + (("le", "+Inf"),)
+                    lines.append(f"{self.PREFIX}_{self.__series(f'{name}_bucket', bucket_labels)} {histogram.count}")
+                    lines.append(f"{self.PREFIX}_{self.__series(f'{name}_sum', labels)} {histogram.total}")
+                    lines.append(f"{self.PREFIX}_{self.__series(f'{name}_count', labels)} {histogram.count}")
+        return "\n".join(lines) + "\n"
+
+    def write_summary(self, s3_repository: Any, stage: str) -> str:
+        """
+        Write the run summary to the bucket, as metrics/{stage}/{timestamp}.json.
+
+        Returns:
+            Path of the stored summary inside the bucket
+        """
+        summary = {"stage": stage, **self.summary()}
+        timestamp = datetime.fromtimestamp(self._started_at).strftime("%Y%m%dT%H%M%S")
+        return s3_repository.upload_file(file_path=f"metrics/{stage}/{timestamp}.json", data=summary)
+
+    def write_prometheus(self, folder_path: str, stage: str) -> str:
+        """Write the metrics as a Prometheus textfile in folder_path, replacing the previous one of the stage."""
+        Path(folder_path).mkdir(parents=True, exist_ok=True)
+        file_path = os.path.join(folder_path, f"{self.PREFIX}_{stage}.prom")
+        temp_path = f"{file_path}.tmp"
+        with open(temp_path, "w") as f:
+            f.write(self.to_prometheus())
+        os.replace(temp_path, file_path)
+        return file_path
+
+    def write_run(self, s3_repository: Any, stage: str, prometheus_path: str = "") -> None:
+        """Write the run summary and, when prometheus_path is set, the Prometheus textfile. Failures are logged only."""
+        try:
+            stored_path = self.write_summary(s3_repository=s3_repository, stage=stage)
+            self.logger.info(f"Metrics summary of {stage} written to {stored_path}")
+            if prometheus_path:
+                self.write_prometheus(folder_path=prometheus_path, stage=stage)
+        except (OSError, TypeError, ValueError) as e:
+            self.logger.warning(f"Failed to write metrics of {stage}: {e}")
+
+    def __labels(self, labels: dict[str, Any]) -> Labels:
+        return tuple(sorted((key, str(value)) for key, value in labels.items()))
+
+    def __series(self, name: str, labels: Labels) -> str:
+        if not labels:
+            return name
+        return name + "{" + ",".join(f'{key}="{self.__escape(value)}"' for key, value in labels) + "}"
+
+    @staticmethod
+    def __escape(value: str) -> str:
+        """Escape a label value as in the Prometheus text format: backslash, double quote and line feed."""
+        return value.replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+metrics = Metrics()
@@ -0,0 +1,190 @@
+import json
+import sqlite3
+import time
+import uuid
+from collections.abc import Iterable, Iterator
+from contextlib import contextmanager
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Any
+
+from src.common.logger import Logger
+
+
+@dataclass
+class Task:
+    id: int
+    body: dict[str, Any]
+    receipt: str
+    receive_count: int
+
+
+@dataclass
+class FinishedTask:
+    body: dict[str, Any]
+    result: dict[str, Any] | None
+    last_error: str | None
+
+
+class WorkQueue:
+    """
+    Durable work queue in a SQLite file, standing in for SQS between the planner and the worker processes.
+
+    Received tasks are leased for visibility_timeout seconds: a task not acked before its lease expires is
+    delivered again, so the tasks of a dead worker are picked up by the others. A task received max_receives
+    times without being acked is moved to the dead letter status.
+    """
+
+    logger = Logger(__name__)
+    PENDING = "pending"
+    DONE = "done"
+    DEAD = "dead"
+
+    def __init__(self, path: str, visibility_timeout: float = 300, max_receives: int = 5):
+        """
+        Args:
+            path: SQLite file of the queue, shared by every process
+            visibility_timeout: Seconds a received task is hidden from other workers
+            max_receives: Deliveries of a task before it is moved to the dead letter status
+        """
+        self.path = path
+        self.visibility_timeout = visibility_timeout
+        self.max_receives = max_receives
+        Path(path).parent.mkdir(parents=True, exist_ok=True)
+        # Autocommit mode, transactions are opened explicitly with BEGIN IMMEDIATE
+        self.connection = sqlite3.connect(path, timeout=60, isolation_level=None)
+        self.connection.execute("PRAGMA journal_mode=WAL")
+        self.connection.execute(
+            """
+            CREATE TABLE IF NOT EXISTS tasks (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                task_key TEXT NOT NULL UNIQUE,
+                body TEXT NOT NULL,
+                status TEXT NOT NULL,
+                visible_at REAL NOT NULL,
+                receive_count INTEGER NOT NULL DEFAULT 0,
+                receipt TEXT,
+                result TEXT,
+                last_error TEXT
+            )
+            """
+        )
+        self.connection.execute("CREATE INDEX IF NOT EXISTS tasks_visible ON tasks (status, visible_at)")
+
+    def enqueue(self, bodies: Iterable[dict[str, Any]]) -> int:
+        """
+        Add tasks to the queue. A task still in the queue, whatever its status, is not added twice.
+
+        Returns:
+            Number of tasks enqueued
+        """
+        now = time.time()
+        rows = [(json.dumps(body, sort_keys=True), self.PENDING, now) for body in bodies]
+        with self.__transaction():
+            changes_before = self.connection.total_changes
+            self.connection.executemany(
+                """
+                INSERT INTO tasks (task_key, body, status, visible_at) VALUES (?1, ?1, ?2, ?3)
+                ON CONFLICT (task_key) DO NOTHING
+                """,
+                rows,
+            )
+            return self.connection.total_changes - changes_before
+
+    def receive(self, max_tasks: int = 1) -> list[Task]:
+        """
+        Lease up to max_tasks visible tasks, each with a new receipt. Tasks out of receives are moved to dead.
+
+        Returns:
+            Leased tasks, empty when no task is visible
+        """
+        now = time.time()
+        with self.__transaction():
+            self.connection.execute(
+                "UPDATE tasks SET status = ? WHERE status = ? AND visible_at <= ? AND receive_count >= ?",
+                [self.DEAD, self.PENDING, now, self.max_receives],
+            )
+            rows = self.connection.execute(
+                "SELECT id, body, receive_count FROM tasks WHERE status = ? AND visible_at <= ? ORDER BY id LIMIT ?",
+                [self.PENDING, now, max_tasks],
+            ).fetchall()
+            tasks = [
+                Task(id=id, body=json.loads(body), receipt=uuid.uuid4().hex, receive_count=count + 1)
+                for id, body, count in rows
+            ]
+            self.connection.executemany(
+                "UPDATE tasks SET visible_at = ?, receive_count = ?, receipt = ? WHERE id = ?",
+                [(now + self.visibility_timeout, task.receive_count, task.receipt, task.id) for task in tasks],
+            )
+        return tasks
+
+    def ack(self, task: Task, result: dict[str, Any] | None = None) -> bool:
+        """
+        Mark a task as done.
+
+        Args:
+            task: Task received by this worker
+            result: Optional outcome of the task, read back by finished
+
+        Returns:
+            False when the lease expired and the task was delivered again, the ack being ignored
+        """
+        with self.__transaction():
+            cursor = self.connection.execute(
+                """
+                UPDATE tasks SET status = ?, result = ?, last_error = NULL
+                WHERE id = ? AND receipt = ? AND status = ?
+                """,
+                [self.DONE, json.dumps(result) if result is not None else None, task.id, task.receipt, self.PENDING],
+            )
+        if cursor.rowcount == 0:
+            self.logger.warning(f"Lease of task {task.id} expired before its ack, it was delivered again")
+        return cursor.rowcount == 1
+
+    def release(self, task: Task, error: str, delay: float = 0) -> None:
+        """Give a failed task back to the queue, visible again after delay seconds."""
+        with self.__transaction():
+            self.connection.execute(
+                "UPDATE tasks SET visible_at = ?, last_error = ? WHERE id = ? AND receipt = ? AND status = ?",
+                [time.time() + delay, error, task.id, task.receipt, self.PENDING],
+            )
+
+    def counts(self) -> dict[str, int]:
+        """Number of tasks per status, pending tasks being split into visible and in_flight (leased or backing off)."""
+        rows = self.connection.execute(
+            """
+            SELECT CASE WHEN status = ?1 AND visible_at > ?2 THEN 'in_flight' ELSE status END, COUNT(*)
+            FROM tasks GROUP BY 1
+            """,
+            [self.PENDING, time.time()],
+        ).fetchall()
+        return {self.PENDING: 0, "in_flight": 0, self.DONE: 0, self.DEAD: 0, **dict(rows)}
+
+    def finished(self, status: str) -> list[FinishedTask]:
+        """Tasks done or dead, with their result and last error."""
+        rows = self.connection.execute(
+            "SELECT body, result, last_error FROM tasks WHERE status = ? ORDER BY id", [status]
+        ).fetchall()
+        return [
+            FinishedTask(body=json.loads(body), result=json.loads(result) if result else None, last_error=last_error)
+            for body, result, last_error in rows
+        ]
+
+    def purge(self, status: str) -> None:
+        """Delete the tasks with a status, e.g. done tasks once they are collected."""
+        with self.__transaction():
+            self.connection.execute("DELETE FROM tasks WHERE status = ?", [status])
+
+    def close(self) -> None:
+        self.connection.close()
+
+    @contextmanager
+    def __transaction(self) -> Iterator[None]:
+        """BEGIN IMMEDIATE transaction, so concurrent workers never lease the same task."""
+        self.connection.execute("BEGIN IMMEDIATE")
+        try:
+            yield
+        except BaseException:
+            self.connection.execute("ROLLBACK")
+            raise
+        self.connection.execute("COMMIT")
@@ -0,0 +1,76 @@
+import queue
+import threading
+from collections.abc import Callable
+from typing import Any
+
+from src.common.logger import Logger
+
+_STOP = object()
+
+
+class WriteBehindQueue:
+    """
+    Bounded queue of writes persisted in the background by a pool of writer threads.
+    Submitting blocks while the queue is full, so producers can never run ahead of the writers unboundedly.
+    """
+
+    logger = Logger(__name__)
+
+    def __init__(self, writer: Callable[[str, Any], Any], workers: int, max_pending: int):
+        """
+        Args:
+            writer: Function persisting one payload, called as writer(file_path, data)
+            workers: Number of writer threads
+            max_pending: Maximum number of submitted writes waiting for a writer
+        """
+        self.writer = writer
+        self.errors: list[tuple[str, Exception]] = []
+        self._queue: queue.Queue = queue.Queue(maxsize=max_pending)
+        self._errors_lock = threading.Lock()
+        self._closed = False
+        self._threads = [
+            threading.Thread(target=self._work, name=f"write-behind-{index}", daemon=True) for index in range(workers)
+        ]
+        for thread in self._threads:
+            thread.start()
+
+    def submit(self, file_path: str, data: Any, on_done: Callable[[Any], None] | None = None) -> None:
+        """
+        Queue a write, blocking while the queue is full.
+
+        Args:
+            file_path: Path of the file to write
+            data: Payload to write
+            on_done: Callback run by the writer thread once the payload is persisted, with the result of the writer
+        """
+        if self._closed:
+            raise RuntimeError("Write-behind queue is closed")
+        self._queue.put((file_path, data, on_done))
+
+    def close(self) -> list[tuple[str, Exception]]:
+        """
+        Wait for every queued write to be persisted and stop the writer threads.
+
+        Returns:
+            List of (file_path, error) for writes that failed
+        """
+        if not self._closed:
+            self._closed = True
+            for _ in self._threads:
+                self._queue.put(_STOP)
+            for thread in self._threads:
+                thread.join()
+        return self.errors
+
+    def _work(self) -> None:
+        while (item := self._queue.get()) is not _STOP:
+            file_path, data, on_done = item
+            try:
+                result = self.writer(file_path, data)
+                if on_done:
+                    on_done(result)
+            # I/O errors (request errors of streamed payloads included) and payloads that can't be serialized
+            except (OSError, ValueError, TypeError) as e:
+                self.logger.error(f"Error writing {file_path}: {e}")
+                with self._errors_lock:
+                    self.errors.append((file_path, e))
@@ -0,0 +1,119 @@
+import os
+import uuid
+from pathlib import Path
+
+import pandas as pd
+from duckdb import DuckDBPyConnection, connect
+
+from src.common.logger import Logger
+
+
+class ParquetRepository:
+    """
+    Repository for simulating a Hive-partitioned Parquet dataset on AWS S3 by storing files locally.
+    Files are written and read through an in-memory DuckDB connection, so the dataset can be shared between processes.
+    """
+
+    logger = Logger(__name__)
+    FILE_NAME = "data.parquet"
+
+    def __init__(self, base_path: str, partition_column: str = "year", row_group_size: int = 122_880):
+        """
+        Args:
+            base_path: Folder of the dataset, partitions are written as {partition_column}={value}/ subfolders
+            partition_column: Column used to partition the dataset
+            row_group_size: Maximum number of rows per Parquet row group
+        """
+        self.base_path = Path(base_path)
+        self.partition_column = partition_column
+        self.row_group_size = row_group_size
+        self.connection: DuckDBPyConnection = connect()
+
+    def partition_path(self, value: int | str) -> Path:
+        return self.base_path / f"{self.partition_column}={value}"
+
+    def upsert_partitions(
+        self, key_columns: list[str], df: pd.DataFrame | None = None, query: str | None = None
+    ) -> None:
+        """
+        Insert or update rows, rewriting only the partitions they belong to.
+        Rows of a partition are merged by key columns with the rows already stored, and the partition is replaced
+        as a whole, so writing the same data twice leaves the dataset unchanged.
+
+        Args:
+            key_columns: Columns identifying a row, including the partition column
+            df: Rows to write, as a pandas DataFrame
+            query: Rows to write, as a DuckDB query (used when df is not given)
+        """
+        incoming_table = "incoming_rows"
+        try:
+            source = "SELECT * FROM df" if df is not None else query
+            self.connection.execute(f"CREATE OR REPLACE TEMP TABLE {incoming_table} AS {source}")
+            partitions = self.connection.execute(
+                f"SELECT DISTINCT {self.partition_column} FROM {incoming_table} ORDER BY 1"
+            ).fetchall()
+            for (value,) in partitions:
+                self.__upsert_partition(value=value, incoming_table=incoming_table, key_columns=key_columns)
+        except Exception as e:
+            self.logger.error(f"Failed to upsert partitions into {self.base_path}: {e}")
+            raise
+        finally:
+            self.connection.execute(f"DROP TABLE IF EXISTS {incoming_table}")
+
+    def __upsert_partition(self, value: int | str, incoming_table: str, key_columns: list[str]) -> None:
+        partition_path = self.partition_path(value)
+        literal = f"'{value}'" if isinstance(value, str) else str(value)
+        incoming_rows = f"SELECT * FROM {incoming_table} WHERE {self.partition_column} = {literal}"
+        merged_rows = incoming_rows
+        if (partition_path / self.FILE_NAME).exists():
+            key_conditions = " AND ".join([f"stored.{col} = incoming.{col}" for col in key_columns])
+            merged_rows = f"""
+            {incoming_rows}
+            UNION ALL BY NAME
+            SELECT stored.* FROM (
+                SELECT *, {literal} AS {self.partition_column}
+                FROM read_parquet('{partition_path / self.FILE_NAME}', hive_partitioning = false)
+            ) AS stored
+            ANTI JOIN ({incoming_rows}) AS incoming ON {key_conditions}
+            """
+
+        # The file is written next to the stored one, which it replaces with an atomic rename:
+        # readers see the old or the new file, never a missing partition
+        partition_path.mkdir(parents=True, exist_ok=True)
+        temp_path = partition_path / f".{self.FILE_NAME}.{uuid.uuid4().hex}.tmp"
+        try:
+            rows = self.connection.execute(
+                f"""
+                COPY (SELECT * EXCLUDE ({self.partition_column}) FROM ({merged_rows}) ORDER BY ALL)
+                TO '{temp_path}' (FORMAT PARQUET, ROW_GROUP_SIZE {self.row_group_size})
+                """
+            ).fetchone()[0]
+            os.replace(temp_path, partition_path / self.FILE_NAME)
+        finally:
+            temp_path.unlink(missing_ok=True)
+
+        self.logger.info(f"Wrote {rows} rows to partition {partition_path}")
+
+    def read(self, columns: list[str] | None = None, partitions: list[int | str] | None = None) -> pd.DataFrame:
+        """
+        Read the dataset into a pandas DataFrame.
+
+        Args:
+            columns: Columns to read, all when not given (only these columns are read from the files)
+            partitions: Values of the partition column to read, all when not given (other partitions are skipped)
+
+        Returns:
+            Rows of the dataset, an empty DataFrame when no partition is stored yet
+        """
+        if not any(self.base_path.glob(f"*/{self.FILE_NAME}")):
+            return pd.DataFrame(columns=columns or [])
+        select = ", ".join(columns) if columns else "*"
+        query = f"SELECT {select} FROM read_parquet('{self.base_path}/*/{self.FILE_NAME}', hive_partitioning = true)"
+        if partitions:
+            values = ", ".join(f"'{value}'" if isinstance(value, str) else str(value) for value in partitions)
+            query += f" WHERE {self.partition_column} IN ({values})"
+        return self.connection.execute(query).df()
+
+    def close_connection(self) -> None:
+        """Close the in-memory DuckDB connection."""
+        self.connection.close()
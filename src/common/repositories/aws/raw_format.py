@@ -0,0 +1,136 @@
+import gzip
+import hashlib
+import io
+import json
+from collections.abc import Iterable
+from pathlib import Path
+from typing import IO, Any
+
+try:
+    import zstandard
+except ImportError:  # optional dependency, only needed for the "ndjson-zstd" format
+    zstandard = None
+
+# Raw format name -> file extension. "json" keeps the legacy pretty-printed layout.
+RAW_FORMATS = {
+    "json": ".json",
+    "json-min": ".json",
+    "ndjson": ".ndjson",
+    "ndjson-gzip": ".ndjson.gz",
+    "ndjson-zstd": ".ndjson.zst",
+}
+# Longest extensions first, so ".ndjson.gz" is matched before ".json" would be considered.
+RAW_EXTENSIONS = sorted(set(RAW_FORMATS.values()), key=len, reverse=True)
+NDJSON_FORMATS = {"ndjson", "ndjson-gzip", "ndjson-zstd"}
+
+
+def validate_raw_format(raw_format: str) -> str:
+    """Check a raw format name is supported, and its optional dependency is installed."""
+    if raw_format not in RAW_FORMATS:
+        raise ValueError(f"Raw format {raw_format} not supported, choose one of {list(RAW_FORMATS)}")
+    if raw_format == "ndjson-zstd" and zstandard is None:
+        raise ImportError("Raw format ndjson-zstd requires the zstandard package")
+    return raw_format
+
+
+def strip_raw_extension(file_path: str) -> str:
+    """Remove any raw extension from a file path."""
+    for extension in RAW_EXTENSIONS:
+        if file_path.endswith(extension):
+            return file_path[: -len(extension)]
+    return file_path
+
+
+def raw_file_path(file_path: str, raw_format: str, is_records: bool) -> str:
+    """
+    Get the stored path of a logical file path for a raw format.
+    Only lists of records are written as NDJSON, any other payload stays as JSON.
+    """
+    if raw_format in NDJSON_FORMATS and not is_records:
+        raw_format = "json-min"
+    return f"{strip_raw_extension(file_path)}{RAW_FORMATS[raw_format]}"
+
+
+def raw_file_candidates(full_path: Path) -> list[Path]:
+    """List the stored paths a logical file path may have in any raw format."""
+    stem = strip_raw_extension(full_path.name)
+    return [full_path.with_name(f"{stem}{extension}") for extension in RAW_EXTENSIONS]
+
+
+def is_ndjson(path: str | Path) -> bool:
+    return ".ndjson" in Path(path).name
+
+
+def open_raw_file(path: str | Path, mode: str, compression_from: str | Path | None = None) -> IO[bytes]:
+    """
+    Open a raw file in binary mode, compressing or decompressing based on its extension.
+
+    Args:
+        path: Path of the file to open
+        mode: "rb" or "wb"
+        compression_from: Path whose extension defines the compression, defaults to path (used for temp files)
+    """
+    path = Path(path)
+    name = Path(compression_from or path).name
+    if name.endswith(".gz"):
+        return gzip.open(path, mode)
+    if name.endswith(".zst"):
+        if zstandard is None:
+            raise ImportError(f"Opening {path} requires the zstandard package")
+        zstd_file = zstandard.open(path, mode)
+        return io.BufferedReader(zstd_file) if "r" in mode else zstd_file
+    return path.open(mode)
+
+
+def canonical_json(data: Any) -> bytes:
+    """Serialize data as canonical JSON (sorted keys, no whitespace), the same whatever the raw format."""
+    return json.dumps(data, sort_keys=True, separators=(",", ":"), ensure_ascii=False).encode("utf-8")
+
+
+class CanonicalRecordsHash:
+    """SHA-256 of the canonical JSON of a list, fed one record at a time, equal to canonical_hash of the list."""
+
+    def __init__(self):
+        self._hash = hashlib.sha256(b"[")
+        self._records = 0
+
+    def update(self, record: Any) -> None:
+        if self._records:
+            self._hash.update(b",")
+        self._hash.update(canonical_json(record))
+        self._records += 1
+
+    def hexdigest(self) -> str:
+        content_hash = self._hash.copy()
+        content_hash.update(b"]")
+        return content_hash.hexdigest()
+
+
+def canonical_hash(data: Any) -> str:
+    """SHA-256 of the canonical JSON of data, so equal payloads have equal hashes in any raw format."""
+    return hashlib.sha256(canonical_json(data)).hexdigest()
+
+
+def write_records_ndjson(f: IO[bytes], records: Iterable[Any]) -> None:
+    """Write records as NDJSON, one minified JSON document per line."""
+    for record in records:
+        f.write(json.dumps(record, ensure_ascii=False, separators=(",", ":")).encode("utf-8"))
+        f.write(b"\n")
+
+
+def write_raw(f: IO[bytes], data: Any, raw_format: str) -> None:
+    """Serialize data to an open raw file in the given format."""
+    if raw_format in NDJSON_FORMATS and isinstance(data, list):
+        write_records_ndjson(f, data)
+        return
+    indent = 2 if raw_format == "json" else None
+    separators = None if indent else (",", ":")
+    f.write(json.dumps(data, indent=indent, separators=separators, ensure_ascii=False).encode("utf-8"))
+
+
+def read_raw(path: str | Path) -> Any:
+    """Deserialize a raw file, detecting JSON or NDJSON and its compression from the extension."""
+    with open_raw_file(path, "rb") as f:
+        if is_ndjson(path):
+            return [json.loads(line) for line in f if line.strip()]
+        return json.load(f)
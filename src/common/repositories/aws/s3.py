@@ -1,39 +1,243 @@
 import json
+import os
+import threading
+from collections.abc import Iterable, Iterator
 from pathlib import Path
 from typing import Any
 
+from src.common.clients.json_stream import iter_json_array
+from src.common.file_lock import file_lock
 from src.common.logger import Logger
+from src.common.metrics import metrics
+from src.common.repositories.aws.raw_format import (
+    NDJSON_FORMATS,
+    CanonicalRecordsHash,
+    canonical_hash,
+    is_ndjson,
+    open_raw_file,
+    raw_file_candidates,
+    raw_file_path,
+    read_raw,
+    validate_raw_format,
+    write_raw,
+    write_records_ndjson,
+)
 
 
 class S3Repository:
     """Repository for simulating AWS S3 service by storing files locally."""
 
     logger = Logger(__name__)
+    HASH_INDEX_FOLDER = "hash_index"
 
-    def __init__(self, bucket_name: str):
+    def __init__(self, bucket_name: str, raw_format: str = "json"):
+        """
+        Args:
+            bucket_name: Folder simulating the bucket
+            raw_format: Storage format of written files (json, json-min, ndjson, ndjson-gzip, ndjson-zstd).
+                Files are read back in whatever format they were written.
+        """
         self.bucket_name = bucket_name
+        self.raw_format = validate_raw_format(raw_format)
+        self.written = 0
+        self.skipped = 0
+        self._hash_lock = threading.Lock()
+        self._hash_indexes: dict[str, dict[str, dict]] = {}
+        self._dirty_names: dict[str, set[str]] = {}
 
-    def upload_file(self, file_path: str, data: Any) -> None:
+    def upload_file(self, file_path: str, data: Any, skip_unchanged: bool = False) -> str | None:
         """
         Simulate uploading a file to S3 by creating it on disk.
+        The extension of file_path is replaced by the one of the raw format.
 
         Args:
             file_path: Folder inside the bucket (subdirectory)
-            data: Data to write to the file (will be serialized as JSON)
+            data: Data to write to the file (will be serialized as JSON, or NDJSON for lists of records)
+            skip_unchanged: Don't write the file when its stored content has the same canonical hash
+
+        Returns:
+            Path of the stored file inside the bucket, None when the write was skipped as unchanged
         """
-        full_path = Path(self.bucket_name) / file_path
-        full_path.parent.mkdir(parents=True, exist_ok=True)
+        stored_path = raw_file_path(file_path, self.raw_format, is_records=isinstance(data, list))
+        content_hash = canonical_hash(data) if skip_unchanged else None
+        if content_hash and self.__is_unchanged(stored_path, content_hash):
+            return None
+
+        with metrics.span("s3_upload"), self._atomic_write(stored_path) as f:
+            write_raw(f, data, self.raw_format)
+        self.__record_written(stored_path, content_hash)
+
+        self.logger.info(f"Successfully uploaded {stored_path}")
+        return stored_path
+
+    def upload_stream(self, file_path: str, chunks: Iterable[bytes], skip_unchanged: bool = False) -> str | None:
+        """
+        Simulate a multipart upload to S3, writing the byte chunks of a JSON array to disk as they arrive.
+        NDJSON formats transcode the array record by record, JSON formats keep the bytes as received.
+
+        Args:
+            file_path: Folder inside the bucket (subdirectory)
+            chunks: Raw bytes of a JSON array
+            skip_unchanged: Keep the stored file when the streamed content has the same canonical hash.
+                The hash is only known at the end of the stream, so the temporary file is written anyway.
+
+        Returns:
+            Path of the stored file inside the bucket, None when the write was skipped as unchanged
+        """
+        stored_path = raw_file_path(file_path, self.raw_format, is_records=True)
+        content_hash = CanonicalRecordsHash() if skip_unchanged else None
+        writer = self._atomic_write(stored_path)
+        with metrics.span("s3_upload"), writer as f:
+            if self.raw_format in NDJSON_FORMATS:
+                write_records_ndjson(f, self.__hash_records(iter_json_array(chunks), content_hash))
+            else:
+                # Records are parsed back from the bytes written, so a truncated or malformed payload
+                # fails before the temporary file is renamed
+                for _ in self.__hash_records(iter_json_array(self.__write_chunks(f, chunks)), content_hash):
+                    pass
+            if content_hash and self.__is_unchanged(stored_path, content_hash.hexdigest()):
+                writer.discard()
+        if writer.discarded:
+            return None
+        self.__record_written(stored_path, content_hash.hexdigest() if content_hash else None)
+
+        self.logger.info(f"Successfully uploaded {stored_path}")
+        return stored_path
+
+    def __write_chunks(self, f: Any, chunks: Iterable[bytes]) -> Iterator[bytes]:
+        for chunk in chunks:
+            f.write(chunk)
+            yield chunk
 
-        with full_path.open("w", encoding="utf-8") as f:
-            json.dump(data, f, indent=2, ensure_ascii=False)
+    def __hash_records(self, records: Iterable[Any], content_hash: CanonicalRecordsHash | None) -> Iterator[Any]:
+        for record in records:
+            if content_hash:
+                content_hash.update(record)
+            yield record
 
-        self.logger.info(f"Successfully uploaded {file_path}")
+    def __hash_index(self, prefix: str) -> dict[str, dict]:
+        """Hash index of a prefix (folder inside the bucket), loaded on first use. Call with the lock held."""
+        if prefix not in self._hash_indexes:
+            try:
+                self._hash_indexes[prefix] = read_raw(self.resolve_path(f"{self.HASH_INDEX_FOLDER}/{prefix}.json"))
+            except FileNotFoundError:
+                self._hash_indexes[prefix] = {}
+        return self._hash_indexes[prefix]
+
+    def __is_unchanged(self, stored_path: str, content_hash: str) -> bool:
+        """Check the hash index: the stored file must exist with the recorded size and content hash."""
+        full_path = Path(self.bucket_name) / stored_path
+        with self._hash_lock:
+            entry = self.__hash_index(str(Path(stored_path).parent)).get(full_path.name)
+        if entry is None or entry["hash"] != content_hash:
+            return False
+        # A compacted file was deleted, its content being kept in the compacted file of its folder
+        if not entry.get("compacted") and (not full_path.exists() or full_path.stat().st_size != entry["size"]):
+            return False
+        with self._hash_lock:
+            self.skipped += 1
+        metrics.increment("s3_skipped_unchanged_total")
+        return True
+
+    def __record_written(self, stored_path: str, content_hash: str | None) -> None:
+        full_path = Path(self.bucket_name) / stored_path
+        size = full_path.stat().st_size
+        metrics.increment("s3_uploaded_bytes_total", size)
+        with self._hash_lock:
+            self.written += 1
+            if content_hash:
+                prefix = str(Path(stored_path).parent)
+                self.__hash_index(prefix)[full_path.name] = {"hash": content_hash, "size": size}
+                self._dirty_names.setdefault(prefix, set()).add(full_path.name)
+
+    def record_compacted(self, stored_path: str, content_hash: str) -> None:
+        """Record a file deleted by compaction, so writing the same content again is skipped."""
+        prefix, name = str(Path(stored_path).parent), Path(stored_path).name
+        with self._hash_lock:
+            self.__hash_index(prefix)[name] = {"hash": content_hash, "size": 0, "compacted": True}
+            self._dirty_names.setdefault(prefix, set()).add(name)
+
+    def flush_hash_indexes(self) -> None:
+        """
+        Save the hash indexes changed since the last flush.
+        Only the entries written by this repository are merged into the stored index, under a lock file,
+        so processes writing other files of the same prefix keep their entries.
+        """
+        with self._hash_lock:
+            changes = {
+                prefix: {name: self._hash_indexes[prefix][name] for name in names}
+                for prefix, names in self._dirty_names.items()
+            }
+            self._dirty_names = {}
+        for prefix, entries in changes.items():
+            index_path = f"{self.HASH_INDEX_FOLDER}/{prefix}.json"
+            with file_lock(Path(self.bucket_name) / f"{index_path}.lock"):
+                try:
+                    index = read_raw(self.resolve_path(index_path))
+                except FileNotFoundError:
+                    index = {}
+                with self._atomic_write(index_path) as f:
+                    write_raw(f, {**index, **entries}, "json-min")
 
     def get_file(self, file_path: str) -> Any:
-        """Get a file from the S3 repository."""
+        """Get a file from the S3 repository, in any raw format."""
+        full_path = self.resolve_path(file_path)
+        with metrics.span("s3_get"):
+            data = read_raw(full_path)
+        metrics.increment("s3_read_bytes_total", full_path.stat().st_size)
+        return data
+
+    def iter_records(self, file_path: str) -> Iterator[Any]:
+        """Read a list of records from the S3 repository one record at a time, in any raw format."""
+        full_path = self.resolve_path(file_path)
+        with open_raw_file(full_path, "rb") as f:
+            if is_ndjson(full_path):
+                yield from (json.loads(line) for line in f if line.strip())
+            else:
+                yield from iter_json_array(iter(lambda: f.read(64 * 1024), b""))
+
+    def resolve_path(self, file_path: str) -> Path:
+        """Find the stored file of a logical file path, whatever raw format it was written in."""
         full_path = Path(self.bucket_name) / file_path
         if full_path.exists():
-            with full_path.open("r", encoding="utf-8") as f:
-                data = json.load(f)
-            return data
+            return full_path
+        for candidate in raw_file_candidates(full_path):
+            if candidate.exists():
+                return candidate
         raise FileNotFoundError(f"File {full_path} not found")
+
+    def _atomic_write(self, stored_path: str) -> "_AtomicRawWriter":
+        return _AtomicRawWriter(Path(self.bucket_name) / stored_path)
+
+
+class _AtomicRawWriter:
+    """
+    Write a raw file through a temporary file renamed on success, so readers never see a partial file.
+    Copies of the same file in other raw formats are removed, so only one version is ever read.
+    """
+
+    def __init__(self, full_path: Path):
+        self.full_path = full_path
+        # Unique per process, since worker processes may write the same file (e.g. a shared index)
+        self.temp_path = full_path.with_name(f"{full_path.name}.{os.getpid()}.tmp")
+        self.discarded = False
+
+    def discard(self) -> None:
+        """Drop the temporary file on exit instead of replacing the stored file."""
+        self.discarded = True
+
+    def __enter__(self):
+        self.full_path.parent.mkdir(parents=True, exist_ok=True)
+        self.file = open_raw_file(self.temp_path, "wb", compression_from=self.full_path)
+        return self.file
+
+    def __exit__(self, exc_type, exc_value, traceback) -> None:
+        self.file.close()
+        if exc_type is not None or self.discarded:
+            self.temp_path.unlink(missing_ok=True)
+            return
+
+        os.replace(self.temp_path, self.full_path)
+        for candidate in raw_file_candidates(self.full_path):
+            if candidate != self.full_path:
+                candidate.unlink(missing_ok=True)
@@ -1,18 +1,81 @@
+import threading
+from collections import OrderedDict
+from collections.abc import Callable, Iterable, Iterator
+from contextlib import contextmanager
+from functools import wraps
+from typing import Any
+
 import pandas as pd
 from duckdb import DuckDBPyConnection, connect
 
 from src.common.logger import Logger
+from src.common.metrics import metrics
+
+
+def serialized_write[T](method: Callable[..., T]) -> Callable[..., T]:
+    """Run a repository method under its write lock, so writes from several threads never interleave."""
+
+    @wraps(method)
+    def wrapper(self: "DuckDBRepository", *args: Any, **kwargs: Any) -> T:
+        with self.writing():
+            return method(self, *args, **kwargs)
+
+    return wrapper
 
 
 class DuckDBRepository:
-    """Repository for DuckDB database, local testing for Snowflake."""
+    """
+    Repository for DuckDB database, local testing for Snowflake.
+
+    Writes go through the connection and are serialized by a write lock. Reads from `query` run on a cursor
+    per thread, so other threads (e.g. a `DuckDBQueryExecutor`) can query the database while a load runs.
+    Other processes open the database with read_only=True, which DuckDB only allows while no process writes it.
+    """
 
     logger = Logger(__name__)
+    QUERY_CACHE_SIZE = 128
 
-    def __init__(self, database_path: str):
+    def __init__(self, database_path: str, read_only: bool = False):
+        """
+        Args:
+            database_path: DuckDB database file
+            read_only: Open the database read-only, every write raising
+        """
         self.database_path = database_path
-        self.connection: DuckDBPyConnection = connect(self.database_path)
+        self.read_only = read_only
+        self.connection: DuckDBPyConnection = connect(self.database_path, read_only=read_only)
+        self._existing_tables: set[str] = set()
+        self._query_cache: OrderedDict[tuple[str, tuple], pd.DataFrame] = OrderedDict()
+        self._cache_lock = threading.Lock()
+        # Incremented by every write, so results read before a write are not cached after it
+        self._cache_generation = 0
+        self._write_lock = threading.RLock()
+        self._local = threading.local()
+        self._cursors: list[DuckDBPyConnection] = []
+
+    @contextmanager
+    def writing(self) -> Iterator[DuckDBPyConnection]:
+        """Hold the write lock, for writes made directly on the connection (e.g. registering views)."""
+        if self.read_only:
+            raise PermissionError(f"DuckDB database {self.database_path} is opened read-only")
+        with self._write_lock:
+            yield self.connection
 
+    def cursor(self) -> DuckDBPyConnection:
+        """Cursor of the current thread, created on first use and closed with the connection."""
+        cursor = getattr(self._local, "cursor", None)
+        if cursor is None:
+            cursor = self._local.cursor = self.connection.cursor()
+            with self._cache_lock:
+                self._cursors.append(cursor)
+        return cursor
+
+    def _invalidate_query_cache(self) -> None:
+        with self._cache_lock:
+            self._query_cache.clear()
+            self._cache_generation += 1
+
+    @serialized_write
     def create_table(self, table_name: str, schema: list[str]) -> None:
         """Create a table in the database.
         Args:
@@ -20,25 +83,48 @@ class DuckDBRepository:
             schema: List of columns (formatted as "column_name column_type") to create
         """
         self.connection.sql(f"CREATE TABLE IF NOT EXISTS {table_name} ({', '.join(schema)})")
+        with self._cache_lock:
+            self._existing_tables.add(table_name)
 
     def table_exists(self, table_name: str) -> bool:
-        """Check if a table exists in the database."""
+        """
+        Check if a table exists in the database, on the cursor of the current thread.
+        Existing tables are cached, so the catalog is queried once.
+        """
+        with self._cache_lock:
+            if table_name in self._existing_tables:
+                return True
         try:
-            result = self.connection.execute(
-                f"SELECT COUNT(*) FROM information_schema.tables WHERE table_name = '{table_name}'"
-            ).fetchone()
-            if result is None:
+            result = (
+                self.cursor()
+                .execute("SELECT COUNT(*) FROM information_schema.tables WHERE table_name = ?", [table_name])
+                .fetchone()
+            )
+            if result is None or result[0] == 0:
                 return False
-            return result[0] > 0
+            with self._cache_lock:
+                self._existing_tables.add(table_name)
+            return True
         except Exception as e:
             self.logger.error(f"Error checking if table {table_name} exists: {str(e)}")
             return False
 
+    def read_table(self, table_name: str) -> pd.DataFrame:
+        """Read a whole table into a pandas DataFrame on the cursor of the current thread, empty if it doesn't exist."""
+        if not self.table_exists(table_name):
+            return pd.DataFrame()
+        return self.cursor().execute(f"SELECT * FROM {table_name}").df()
+
     def close_connection(self) -> None:
-        """Close the connection to the database."""
+        """Close the cursors of every thread and the connection to the database."""
+        with self._cache_lock:
+            cursors, self._cursors = self._cursors, []
+        for cursor in cursors:
+            cursor.close()
         self.connection.close()
         self.logger.info("Connection to DuckDB closed")
 
+    @serialized_write
     def insert_data_from_pandas(
         self,
         df: pd.DataFrame,
@@ -55,12 +141,74 @@ class DuckDBRepository:
                 self.create_table(table_name=table_name, schema=schema_duckdb)
 
             self.connection.execute(f"INSERT INTO {table_name} BY NAME SELECT * FROM df")
+            self._invalidate_query_cache()
             self.logger.info(f"Inserted {len(df)} rows into table {table_name}")
 
         except Exception as e:
             self.logger.error(f"Failed to insert data into table {table_name}: {str(e)}")
             raise
 
+    @serialized_write
+    def replace_data_from_pandas(
+        self,
+        df: pd.DataFrame,
+        table_name: str,
+        key_column: str,
+        keys: list[str],
+        schema_duckdb: list[str] | None = None,
+    ) -> None:
+        """
+        Replace the rows of a table whose key_column is in keys with the rows of a pandas DataFrame,
+        in a single transaction, so loading the same keys twice leaves the table unchanged.
+        """
+        try:
+            if not self.table_exists(table_name):
+                if schema_duckdb is None:
+                    raise ValueError(f"Table {table_name} doesn't exist and no schema provided")
+                self.create_table(table_name=table_name, schema=schema_duckdb)
+
+            self.connection.execute("BEGIN TRANSACTION")
+            try:
+                deleted = self.connection.execute(
+                    f"DELETE FROM {table_name} WHERE {key_column} IN (SELECT UNNEST(?::VARCHAR[]))", [keys]
+                ).fetchone()[0]
+                if not df.empty:
+                    self.connection.execute(f"INSERT INTO {table_name} BY NAME SELECT * FROM df")
+                self.connection.execute("COMMIT")
+            except Exception:
+                self.connection.execute("ROLLBACK")
+                raise
+            self._invalidate_query_cache()
+            self.logger.info(f"Replaced {deleted} rows with {len(df)} rows in table {table_name}")
+
+        except Exception as e:
+            self.logger.error(f"Failed to replace data in table {table_name}: {e}")
+            raise
+
+    @serialized_write
+    def create_table_from_query(self, table_name: str, query: str) -> int:
+        """
+        Create or replace a table with the result of a query, e.g. to stage a scan read several times.
+        Unlike a temp table, it is visible to the cursors of every thread.
+
+        Returns:
+            Number of rows of the table
+        """
+        self.connection.execute(f"CREATE OR REPLACE TABLE {table_name} AS {query}")
+        with self._cache_lock:
+            self._existing_tables.add(table_name)
+        self._invalidate_query_cache()
+        return self.connection.execute(f"SELECT COUNT(*) FROM {table_name}").fetchone()[0]
+
+    @serialized_write
+    def drop_table(self, table_name: str) -> None:
+        """Drop a table if it exists."""
+        self.connection.execute(f"DROP TABLE IF EXISTS {table_name}")
+        with self._cache_lock:
+            self._existing_tables.discard(table_name)
+        self._invalidate_query_cache()
+
+    @serialized_write
     def upsert_data_from_pandas(
         self,
         df: pd.DataFrame,
@@ -80,18 +228,102 @@ class DuckDBRepository:
 
             table_exists = self.table_exists(table_name)
 
-            if not table_exists:
-                self.insert_data_from_pandas(df=df, table_name=table_name, schema_duckdb=schema_duckdb)
-                return
-
-            self._perform_upsert_merge(
-                df=df, table_name=table_name, key_columns=key_columns, schema_duckdb=schema_duckdb
-            )
+            with metrics.span("duckdb_upsert", table=table_name):
+                if not table_exists:
+                    self.insert_data_from_pandas(df=df, table_name=table_name, schema_duckdb=schema_duckdb)
+                else:
+                    self._perform_upsert_merge(
+                        df=df, table_name=table_name, key_columns=key_columns, schema_duckdb=schema_duckdb
+                    )
+            metrics.increment("duckdb_upserted_rows_total", len(df), table=table_name)
 
         except Exception as e:
             self.logger.error(f"Failed to upsert data into table {table_name}: {str(e)}")
             raise
 
+    @serialized_write
+    def upsert_data_from_query(
+        self,
+        query: str,
+        table_name: str,
+        key_columns: list[str],
+        schema_duckdb: list[str] | None = None,
+    ) -> None:
+        """Insert or update the result of a query into a DuckDB table with a single statement, without pandas."""
+        try:
+            with metrics.span("duckdb_upsert", table=table_name):
+                if not self.table_exists(table_name):
+                    if schema_duckdb is None:
+                        raise ValueError(f"Table {table_name} doesn't exist and no schema provided")
+                    self.create_table(table_name=table_name, schema=schema_duckdb)
+                    rows = self.connection.execute(f"INSERT INTO {table_name} BY NAME {query}").fetchone()[0]
+                    self._invalidate_query_cache()
+                    metrics.increment("duckdb_upserted_rows_total", rows, table=table_name)
+                    self.logger.info(f"Inserted {rows} rows into table {table_name}")
+                    return
+
+                columns = self.connection.sql(query).columns
+                missing_keys = [col for col in key_columns if col not in columns]
+                if missing_keys:
+                    raise ValueError(f"Key columns {missing_keys} not found in query result")
+
+                rows = self._merge_from_table(
+                    source_table=f"({query})", table_name=table_name, key_columns=key_columns, columns=columns
+                )
+            metrics.increment("duckdb_upserted_rows_total", rows, table=table_name)
+            self.logger.info(f"Successfully upserted {rows} rows into table {table_name}")
+
+        except Exception as e:
+            self.logger.error(f"Failed to upsert data into table {table_name}: {e}")
+            raise
+
+    @serialized_write
+    def upsert_batches(
+        self,
+        batches: Iterable[Any],
+        table_name: str,
+        key_columns: list[str],
+        schema_duckdb: list[str] | None = None,
+    ) -> None:
+        """
+        Insert or update many batches into a DuckDB table with a single MERGE.
+        Batches are pandas DataFrames, or Arrow tables or record batches when pyarrow is installed, and are
+        registered as views, so DuckDB scans them in place without copying them into a staging table.
+        """
+        views = []
+        try:
+            for index, batch in enumerate(batches):
+                if len(batch) == 0:
+                    continue
+                view_name = f"{table_name}_batch_{index}"
+                self.connection.register(view_name, batch)
+                views.append(view_name)
+
+            if not views:
+                self.logger.warning(f"Batches are empty, skipping upsert for table {table_name}")
+                return
+
+            query = " UNION ALL BY NAME ".join(f"SELECT * FROM {view_name}" for view_name in views)
+            self.upsert_data_from_query(
+                query=query, table_name=table_name, key_columns=key_columns, schema_duckdb=schema_duckdb
+            )
+        finally:
+            for view_name in views:
+                self.connection.unregister(view_name)
+
+    def read_json_query(self, json_files: list[str], projection: list[str] | None = None) -> str:
+        """
+        Build a query scanning JSON or NDJSON files (optionally compressed) with DuckDB's read_json.
+        The scan exposes a filename column with the source file of each row.
+
+        Args:
+            json_files: Files to scan, in a single pass
+            projection: SQL expressions to select, all columns when not given
+        """
+        files = ", ".join("'" + json_file.replace("'", "''") + "'" for json_file in json_files)
+        select = ", ".join(projection) if projection else "*"
+        return f"SELECT {select} FROM read_json([{files}], format = 'auto', union_by_name = true, filename = true)"
+
     def _perform_upsert_merge(
         self, df: pd.DataFrame, table_name: str, key_columns: list[str], schema_duckdb: list[str] | None = None
     ) -> None:
@@ -101,24 +333,9 @@ class DuckDBRepository:
 
             self.connection.execute(f"CREATE TEMP TABLE {temp_table} AS SELECT * FROM df")
 
-            key_conditions = " AND ".join([f"target.{col} = source.{col}" for col in key_columns])
-
-            all_columns = df.columns.tolist()
-            update_columns = [col for col in all_columns if col not in key_columns]
-
-            if update_columns:
-                update_set = ", ".join([f"{col} = source.{col}" for col in update_columns])
-                insert_columns = ", ".join(all_columns)
-                insert_values = ", ".join([f"source.{col}" for col in all_columns])
-                merge_sql = f"""
-                MERGE INTO {table_name} AS target
-                USING {temp_table} AS source
-                ON {key_conditions}
-                WHEN MATCHED THEN UPDATE SET {update_set}
-                WHEN NOT MATCHED THEN INSERT ({insert_columns}) VALUES ({insert_values})
-                """
-
-            self.connection.execute(merge_sql)
+            self._merge_from_table(
+                source_table=temp_table, table_name=table_name, key_columns=key_columns, columns=df.columns.tolist()
+            )
 
             self.logger.info(f"Successfully upserted {len(df)} rows into table {table_name}")
 
@@ -127,3 +344,90 @@ class DuckDBRepository:
             raise
         finally:
             self.connection.execute(f"DROP TABLE IF EXISTS {temp_table}")
+
+    def _merge_from_table(self, source_table: str, table_name: str, key_columns: list[str], columns: list[str]) -> int:
+        """
+        MERGE the rows of a source table (or parenthesized subquery) into a table, matching rows by key columns.
+
+        Returns:
+            Number of inserted or updated rows
+        """
+        key_conditions = " AND ".join([f"target.{col} = source.{col}" for col in key_columns])
+        update_columns = [col for col in columns if col not in key_columns]
+        insert_columns = ", ".join(columns)
+        insert_values = ", ".join([f"source.{col}" for col in columns])
+
+        when_matched = ""
+        if update_columns:
+            update_set = ", ".join([f"{col} = source.{col}" for col in update_columns])
+            when_matched = f"WHEN MATCHED THEN UPDATE SET {update_set}"
+
+        merge_sql = f"""
+        MERGE INTO {table_name} AS target
+        USING {source_table} AS source
+        ON {key_conditions}
+        {when_matched}
+        WHEN NOT MATCHED THEN INSERT ({insert_columns}) VALUES ({insert_values})
+        """
+        rows = self.connection.execute(merge_sql).fetchone()[0]
+        self._invalidate_query_cache()
+        return rows
+
+    @serialized_write
+    def refresh_materialized(self, table_name: str, query: str, affected_query: str, key_columns: list[str]) -> int:
+        """
+        Incrementally refresh a materialized table: rows matching the affected keys are deleted and recomputed,
+        in a single transaction. The table is created from the query on the first refresh.
+
+        Args:
+            table_name: Materialized table to refresh
+            query: Query computing the rows of the affected keys, reading them from the "affected" table
+            affected_query: Query returning the affected values of the key columns
+            key_columns: Columns identifying the rows to refresh
+
+        Returns:
+            Number of recomputed rows
+        """
+        try:
+            self.connection.execute(f"CREATE OR REPLACE TEMP TABLE affected AS {affected_query}")
+            self.connection.execute(f"CREATE TABLE IF NOT EXISTS {table_name} AS SELECT * FROM ({query}) LIMIT 0")
+            self._existing_tables.add(table_name)
+            key_conditions = " AND ".join([f"{table_name}.{col} = affected.{col}" for col in key_columns])
+
+            self.connection.execute("BEGIN TRANSACTION")
+            try:
+                self.connection.execute(f"DELETE FROM {table_name} USING affected WHERE {key_conditions}")
+                rows = self.connection.execute(f"INSERT INTO {table_name} BY NAME {query}").fetchone()[0]
+                self.connection.execute("COMMIT")
+            except Exception:
+                self.connection.execute("ROLLBACK")
+                raise
+            self._invalidate_query_cache()
+            self.logger.info(f"Refreshed {rows} rows of materialized table {table_name}")
+            return rows
+        except Exception as e:
+            self.logger.error(f"Failed to refresh materialized table {table_name}: {e}")
+            raise
+        finally:
+            self.connection.execute("DROP TABLE IF EXISTS affected")
+
+    def query(self, sql: str, params: list[Any] | None = None) -> pd.DataFrame:
+        """
+        Run a read query on the cursor of the current thread, serving repeated queries from a result cache.
+        The cache keeps the last QUERY_CACHE_SIZE results and is cleared by every write through this repository.
+        """
+        key = (sql, tuple(params or ()))
+        with self._cache_lock:
+            if key in self._query_cache:
+                self._query_cache.move_to_end(key)
+                return self._query_cache[key].copy()
+            generation = self._cache_generation
+
+        with metrics.span("duckdb_query"):
+            result = self.cursor().execute(sql, params or []).df()
+        with self._cache_lock:
+            if generation == self._cache_generation:
+                self._query_cache[key] = result
+                if len(self._query_cache) > self.QUERY_CACHE_SIZE:
+                    self._query_cache.popitem(last=False)
+        return result.copy()
@@ -0,0 +1,58 @@
+from collections.abc import Callable
+from concurrent.futures import Future, ThreadPoolExecutor
+from types import TracebackType
+from typing import Any, Self
+
+import pandas as pd
+
+from src.common.repositories.snowflake.duckdb import DuckDBRepository
+
+
+class DuckDBQueryExecutor:
+    """
+    Run queries concurrently against a DuckDB repository, e.g. for dashboards sharing the database with a load.
+    Reads run on the cursor of each worker thread, at most max_workers at once; writes submitted here wait
+    for the write lock of the repository, so they are serialized with the load.
+    """
+
+    def __init__(self, duckdb_repository: DuckDBRepository, max_workers: int = 4):
+        """
+        Args:
+            duckdb_repository: Repository to query, read-only or not
+            max_workers: Maximum number of queries running at once
+        """
+        self.duckdb_repository = duckdb_repository
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="duckdb-query")
+
+    def submit(self, sql: str, params: list[Any] | None = None) -> Future[pd.DataFrame]:
+        """Submit a read query, returning a future of its result."""
+        return self._executor.submit(self.duckdb_repository.query, sql, params)
+
+    def map(self, queries: list[tuple[str, list[Any] | None]]) -> list[pd.DataFrame]:
+        """Run (sql, params) read queries concurrently, returning their results in order."""
+        futures = [self.submit(sql, params) for sql, params in queries]
+        return [future.result() for future in futures]
+
+    def submit_write[T](self, write: Callable[..., T], *args: Any, **kwargs: Any) -> Future[T]:
+        """Submit a write, e.g. a repository upsert method, run under the write lock of the repository."""
+
+        def run_write() -> T:
+            with self.duckdb_repository.writing():
+                return write(*args, **kwargs)
+
+        return self._executor.submit(run_write)
+
+    def close(self) -> None:
+        """Wait for the submitted queries and stop the worker threads."""
+        self._executor.shutdown(wait=True)
+
+    def __enter__(self) -> Self:
+        return self
+
+    def __exit__(
+        self,
+        exc_type: type[BaseException] | None,
+        exc_value: BaseException | None,
+        traceback: TracebackType | None,
+    ) -> None:
+        self.close()
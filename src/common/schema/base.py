@@ -1,37 +1,175 @@
 from dataclasses import dataclass
+from functools import cached_property
+from typing import ClassVar
+
+import pandas as pd
 
 from src.common.schema.conversion_types_python_duckdb import mapping_types_pandas_duckdb
 
+REJECT_RULE_COLUMN = "reject_rule"
+REJECT_SOURCE_COLUMN = "source_file"
+
 
 @dataclass
 class Column:
-    """Class to represent a Column in a schema"""
+    """
+    Class to represent a Column in a schema, with its validation rules: merge keys and columns not nullable
+    reject missing values, values must be in allowed_values (or categories) and between min_value and max_value.
+    """
 
     name: str
     column_type: str
     rename: str | None = None
     merge_key: bool = False
+    compact_type: str | None = None
+    categories: list[str] | None = None
+    nullable: bool = True
+    min_value: float | None = None
+    max_value: float | None = None
+    allowed_values: list[str] | None = None
+
+    @property
+    def required(self) -> bool:
+        return self.merge_key or not self.nullable
+
+    @property
+    def accepted_values(self) -> list[str] | None:
+        return self.allowed_values or self.categories
+
+    def resolve_type(self, compact: bool = False, float32: bool = False) -> str:
+        """Get the pandas type of the column, its compact type in compact mode."""
+        if not compact:
+            return self.column_type
+        if float32 and self.column_type == "float64":
+            return "float32"
+        return self.compact_type or self.column_type
 
 
 class BaseSchema:
-    columns: list[Column]
+    """
+    Base class of schemas. Properties are compiled once per instance and cached.
 
-    @property
+    Args:
+        compact: Use the compact type of columns (smaller integers, categories for low-cardinality strings)
+        float32: In compact mode, also store float64 columns as float32
+    """
+
+    columns: ClassVar[list[Column]]
+
+    def __init__(self, compact: bool = False, float32: bool = False):
+        self.compact = compact
+        self.float32 = float32
+
+    @cached_property
     def rename_columns(self) -> dict[str, str]:
         return {column.rename: column.name for column in self.columns if column.rename}
 
-    @property
+    @cached_property
     def enforce_types(self) -> dict[str, str]:
-        return {column.name: column.column_type for column in self.columns}
+        return {column.name: column.resolve_type(self.compact, self.float32) for column in self.columns}
 
-    @property
-    def schema_duckdb(self) -> dict[str, str]:
-        return [f"{column.name} {mapping_types_pandas_duckdb[column.column_type]}" for column in self.columns]
+    @cached_property
+    def pandas_types(self) -> dict[str, str | pd.CategoricalDtype]:
+        """Types to give to DataFrame.astype, with categorical dtypes for columns with fixed categories."""
+        pandas_types = dict(self.enforce_types)
+        for column in self.columns:
+            if pandas_types[column.name] == "category" and column.categories:
+                pandas_types[column.name] = pd.CategoricalDtype(column.categories)
+        return pandas_types
 
-    @property
+    @cached_property
+    def duckdb_types(self) -> dict[str, str]:
+        """DuckDB type of each column, an ENUM for category columns with fixed categories."""
+        duckdb_types = {}
+        for column in self.columns:
+            column_type = self.enforce_types[column.name]
+            if column_type == "category" and column.categories:
+                values = ", ".join("'" + value.replace("'", "''") + "'" for value in column.categories)
+                duckdb_types[column.name] = f"ENUM({values})"
+            else:
+                duckdb_types[column.name] = mapping_types_pandas_duckdb[column_type]
+        return duckdb_types
+
+    @cached_property
+    def schema_duckdb(self) -> list[str]:
+        return [f"{column.name} {self.duckdb_types[column.name]}" for column in self.columns]
+
+    @cached_property
     def select_columns(self) -> list[str]:
         return [column.name for column in self.columns]
 
-    @property
+    @cached_property
     def merge_key_columns(self) -> list[str]:
         return [column.name for column in self.columns if column.merge_key]
+
+    @cached_property
+    def reject_schema_duckdb(self) -> list[str]:
+        """
+        Schema of the reject table: raw values of the columns as text, the broken rule, the raw file of the row
+        and the reject time.
+        """
+        return [f"{column.name} VARCHAR" for column in self.columns] + [
+            f"{REJECT_RULE_COLUMN} VARCHAR",
+            f"{REJECT_SOURCE_COLUMN} VARCHAR",
+            "rejected_at TIMESTAMP",
+        ]
+
+    @cached_property
+    def sql_reject_rule(self) -> str:
+        """
+        SQL expression over the raw source giving the first rule broken by a row, NULL for valid rows.
+        Key uniqueness is checked on the whole scan, see sql_duplicate_key_rule.
+        """
+        checks = []
+        for column in self.columns:
+            source = f'"{column.rename or column.name}"'
+            typed = f"TRY_CAST({source} AS {self.duckdb_types[column.name]})"
+            if column.required:
+                checks.append((f"{source} IS NULL", "not_null"))
+            if column.accepted_values:
+                values = ", ".join("'" + value.replace("'", "''") + "'" for value in column.accepted_values)
+                checks.append((f"CAST({source} AS VARCHAR) NOT IN ({values})", "allowed_values"))
+            invalid = f"{typed} IS NULL"
+            if column.column_type.startswith("int"):
+                # DuckDB rounds decimals cast to integers, the pandas validation rejects them
+                invalid += f" OR {typed} <> TRY_CAST({source} AS DOUBLE)"
+            checks.append((f"{source} IS NOT NULL AND ({invalid})", "invalid_type"))
+            if column.min_value is not None:
+                checks.append((f"{typed} < {column.min_value}", "range"))
+            if column.max_value is not None:
+                checks.append((f"{typed} > {column.max_value}", "range"))
+        return "CASE " + " ".join(f"WHEN {condition} THEN '{rule}'" for condition, rule in checks) + " END"
+
+    @cached_property
+    def sql_duplicate_key_rule(self) -> str:
+        """
+        SQL expression over rows with a reject_rule column keeping one valid row per merge key, from the last file
+        by name, and rejecting the others as duplicate_key.
+        """
+        keys = ", ".join(self.merge_key_columns)
+        return (
+            f"CASE WHEN {REJECT_RULE_COLUMN} IS NULL AND ROW_NUMBER() OVER "
+            f"(PARTITION BY {keys}, {REJECT_RULE_COLUMN} IS NULL ORDER BY filename DESC) > 1 "
+            f"THEN 'duplicate_key' ELSE {REJECT_RULE_COLUMN} END"
+        )
+
+    @cached_property
+    def sql_validation_projection(self) -> list[str]:
+        """
+        SQL expressions selecting the columns cast with TRY_CAST, their raw values as text (raw_{name})
+        and the reject rule of each row, to stage raw rows before they are split into valid and rejected rows.
+        """
+        typed = [
+            f'TRY_CAST("{column.rename or column.name}" AS {self.duckdb_types[column.name]}) AS {column.name}'
+            for column in self.columns
+        ]
+        raw = [f'CAST("{column.rename or column.name}" AS VARCHAR) AS raw_{column.name}' for column in self.columns]
+        return typed + raw + [f"{self.sql_reject_rule} AS {REJECT_RULE_COLUMN}", "filename"]
+
+    @cached_property
+    def sql_projection(self) -> list[str]:
+        """SQL expressions renaming, casting and selecting the columns from the raw source."""
+        return [
+            f'CAST("{column.rename or column.name}" AS {self.duckdb_types[column.name]}) AS {column.name}'
+            for column in self.columns
+        ]
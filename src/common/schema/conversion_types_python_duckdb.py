@@ -1,7 +1,11 @@
 mapping_types_pandas_duckdb = {
     "int64": "BIGINT",
+    "int32": "INTEGER",
+    "int16": "SMALLINT",
+    "float32": "FLOAT",
     "float64": "DOUBLE",
     "object": "VARCHAR",
+    "category": "VARCHAR",
     "bool": "BOOLEAN",
     "datetime": "TIMESTAMP",
     "date": "DATE",
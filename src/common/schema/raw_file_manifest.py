@@ -0,0 +1,14 @@
+from typing import ClassVar
+
+from src.common.schema.base import BaseSchema, Column
+
+
+class RawFileManifestSchema(BaseSchema):
+    """Raw files already processed by a trusted ETL, used to detect new or changed files."""
+
+    columns: ClassVar[list[Column]] = [
+        Column(name="path", column_type="object", merge_key=True),
+        Column(name="size", column_type="int64"),
+        Column(name="mtime", column_type="float64"),
+        Column(name="content_hash", column_type="object"),
+    ]
@@ -1,9 +1,20 @@
-from typing import Generator
+import argparse
+from collections.abc import Generator, Iterator
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from datetime import datetime
+from functools import partial
+from pathlib import Path
+from typing import Any
 
+import requests
+
+from src.common.availability import AvailabilityIndex
 from src.common.checkpoint import Checkpoint
+from src.common.dead_letter import DeadLetterStore
 from src.common.etl.functions.range_years import range_years
 from src.common.logger import Logger
-from src.common.repositories.aws.s3 import S3Repository
+from src.common.metrics import metrics
+from src.common.repositories.aws.raw_format import strip_raw_extension
 from src.raw.global_footprint_network.endpoints import GlobalFootprintNetworkEndpoints
 from src.raw.global_footprint_network.ingestion import GlobalFootprintNetworkIngestion
 
@@ -16,9 +27,23 @@ class GlobalFootprintNetworkAPIRequest(GlobalFootprintNetworkEndpoints):
     def __init__(self):
         super().__init__()
         self.ingestion_errors: list[str] = []
-        self.checkpoint = Checkpoint(bucket_name=self.environment.RAW_PATH)
-        self.s3_repository = S3Repository(bucket_name=self.environment.RAW_PATH)
-        self.ingestion = GlobalFootprintNetworkIngestion()
+        self.checkpoint = Checkpoint(
+            bucket_name=self.environment.RAW_PATH,
+            flush_every_items=self.environment.CHECKPOINT_FLUSH_ITEMS,
+            flush_every_seconds=self.environment.CHECKPOINT_FLUSH_SECONDS,
+        )
+        self.ingestion = GlobalFootprintNetworkIngestion(s3_repository=self.s3_repository)
+        self.dead_letters = DeadLetterStore(bucket_name=self.environment.RAW_PATH)
+        self.fused_loader: Any = None
+        self.availability: AvailabilityIndex | None = None
+        if self.environment.AVAILABILITY_INDEX:
+            self.availability = AvailabilityIndex(
+                bucket_name=self.environment.RAW_PATH,
+                empty_ttl=self.environment.AVAILABILITY_EMPTY_TTL_SECONDS,
+                error_ttl=self.environment.AVAILABILITY_ERROR_TTL_SECONDS,
+                years_ttl=self.environment.AVAILABILITY_YEARS_TTL_SECONDS,
+            )
+        self.started_at = datetime.now()
 
     def get_countries_codes(self, countries: list[dict]) -> list[dict]:
         """Create a sorted list of countries codes from the countries list. Exclude "all" country code."""
@@ -34,65 +59,177 @@ class GlobalFootprintNetworkAPIRequest(GlobalFootprintNetworkEndpoints):
             return False
         return True
 
-    def __go_next_year(self, year: int, valide_years: list[int], checkpoint: dict) -> bool:
+    def __go_next_year(self, year: int, valide_years: list[int]) -> bool:
         year_valide = self.__is_year_valide(year=year, valide_years=valide_years)
-        resume_checkpoint = self.__resume_from_checkpoint(
-            year=year, country_code=self.CODE_COUNTRY_ALL, checkpoint=checkpoint
-        )
-        return not (year_valide) or resume_checkpoint
+        return not (year_valide) or self.__resume_from_checkpoint(year=year, country_code=self.CODE_COUNTRY_ALL)
+
+    def __resume_from_checkpoint(self, year: int, country_code: str) -> bool:
+        """Check if the pair was already completed in a previous run."""
+        return self.environment.CHECKPOINT and self.checkpoint.is_completed(year=year, country_code=country_code)
+
+    def __complete_years(self, countries_codes: list[str], start_year: int, end_year: int) -> None:
+        """Mark years whose countries were all completed separately as completed, like an "all" payload."""
+        for year in range_years(start_year, end_year):
+            if self.checkpoint.is_completed(year=year, country_code=self.CODE_COUNTRY_ALL):
+                continue
+            if countries_codes and all(
+                self.checkpoint.is_completed(year=year, country_code=code) for code in countries_codes
+            ):
+                self.checkpoint.mark_completed(year=year, country_code=self.CODE_COUNTRY_ALL)
+
+    def __fetch_countries_data(
+        self, year: int, countries_codes: list[str]
+    ) -> Generator[tuple[str, list[dict] | None, Exception | None], None, None]:
+        """
+        Fetch data for every country of a year, concurrently when MAX_WORKERS > 1.
+        Results are yielded as they finish, so the order may differ from countries_codes.
+        """
+        if self.environment.MAX_WORKERS <= 1:
+            for country_code in countries_codes:
+                try:
+                    data = self.get_data(country_code=country_code, year=year)
+                except Exception as e:
+                    yield country_code, None, e
+                    continue
+                yield country_code, data, None
+            return
 
-    def __resume_from_checkpoint(self, year: int, country_code: str, checkpoint: dict) -> bool:
-        """Check if the pipeline should resume from the checkpoint."""
-        if self.environment.CHECKPOINT and checkpoint:
-            checkpoint_year = checkpoint["year"]
-            checkpoint_country = checkpoint["country_code"]
-            if checkpoint_year > year or (checkpoint_year == year and checkpoint_country >= country_code):
-                return True
-        return False
+        executor = ThreadPoolExecutor(max_workers=self.environment.MAX_WORKERS)
+        try:
+            futures = {
+                executor.submit(self.get_data, country_code=country_code, year=year): country_code
+                for country_code in countries_codes
+            }
+            for future in as_completed(futures):
+                country_code = futures[future]
+                if (error := future.exception()) is not None:
+                    yield country_code, None, error
+                    continue
+                yield country_code, future.result(), None
+        finally:
+            executor.shutdown(wait=True, cancel_futures=True)
+
+    def __get_all_countries_data(self, year: int) -> list[dict] | Iterator[bytes] | None:
+        if self.availability and self.availability.is_known_unavailable(year=year, country_code=self.CODE_COUNTRY_ALL):
+            self.logger.info(f"Data for all countries in {year} known to be unavailable, requesting countries")
+            return None
+        try:
+            if self.environment.STREAM_ALL_COUNTRIES:
+                all_countries_data = self.stream_all_countries_data(year=year)
+            else:
+                all_countries_data = self.get_all_countries_data(year=year)
+        except (requests.RequestException, ValueError) as e:
+            # A failed request falls back to countries too, but is only remembered for AVAILABILITY_ERROR_TTL_SECONDS
+            self.logger.error(f"Error getting data for all countries for {year}: {e}")
+            if self.availability:
+                self.availability.record(year=year, country_code=self.CODE_COUNTRY_ALL, status=AvailabilityIndex.ERROR)
+            return None
+        if self.availability:
+            status = AvailabilityIndex.DATA if all_countries_data else AvailabilityIndex.EMPTY
+            self.availability.record(year=year, country_code=self.CODE_COUNTRY_ALL, status=status)
+        return all_countries_data
+
+    def __get_valide_years(self) -> list[int]:
+        """Get the valid years, from the availability index while it is fresh."""
+        if self.availability is None:
+            return self.get_years()
+        if (valide_years := self.availability.cached_years()) is None:
+            valide_years = self.get_years()
+            self.availability.record_years(valide_years)
+        return valide_years
 
     def get_footprint_data(
         self, countries_codes: list, start_year: int, end_year: int
-    ) -> Generator[tuple[int, str, list[dict]], None, None]:
-        """Get data from the Global Footprint Network API."""
+    ) -> Generator[tuple[int, str, list[dict] | Iterator[bytes]], None, None]:
+        """
+        Get data from the Global Footprint Network API.
+        With STREAM_ALL_COUNTRIES, "all" payloads are yielded as raw byte chunks instead of decoded records.
+        """
 
         years = range_years(start_year, end_year)
-        valide_years = self.get_years()
-        checkpoint = self.checkpoint.get_checkpoint()
-        if self.environment.CHECKPOINT and checkpoint:
-            self.logger.info(f"Resuming from checkpoint: {checkpoint}")
+        valide_years = self.__get_valide_years()
+        if self.environment.CHECKPOINT and self.checkpoint.completed_items:
+            self.logger.info(f"Resuming from checkpoint: {self.checkpoint.completed_items} items already completed")
 
         for year in years:
-            if self.__go_next_year(year=year, valide_years=valide_years, checkpoint=checkpoint):
+            if self.__go_next_year(year=year, valide_years=valide_years):
                 continue
 
-            if all_countries_data := self.get_all_countries_data(year=year):
+            if all_countries_data := self.__get_all_countries_data(year=year):
                 yield year, self.CODE_COUNTRY_ALL, all_countries_data
                 continue
 
-            for country_code in countries_codes:
-                if self.__resume_from_checkpoint(year=year, country_code=country_code, checkpoint=checkpoint):
+            pending_codes = [
+                country_code
+                for country_code in countries_codes
+                if not self.__resume_from_checkpoint(year=year, country_code=country_code)
+            ]
+            if self.availability:
+                pending_codes = self.availability.prioritize(year=year, countries_codes=pending_codes)
+
+            for country_code, data, error in self.__fetch_countries_data(year=year, countries_codes=pending_codes):
+                if self.availability:
+                    self.availability.record_payload(year=year, country_code=country_code, data=data, error=error)
+                if error is not None:
+                    self.ingestion_errors.append(f"Error getting data for {country_code} in {year}: {error}")
+                    self.__record_dead_letter(year=year, country_code=country_code, error=error)
                     continue
+                yield year, country_code, data
 
-                try:
-                    data = self.get_data(country_code=country_code, year=year)
-                    yield year, country_code, data
-                except Exception as e:
-                    self.ingestion_errors.append(f"Error getting data for {country_code} in {year}: {e}")
+    def __record_dead_letter(self, year: int, country_code: str, error: Exception) -> None:
+        self.dead_letters.record(
+            year=year,
+            country_code=country_code,
+            endpoint=f"{self.DATA}/{country_code}/{year}",
+            error_class=type(error).__name__,
+            error=str(error),
+        )
 
     def __load_ingestion_errors(self) -> None:
         """Ingestion errors into the S3 repository."""
         if self.ingestion_errors:
             self.s3_repository.upload_file(
-                file_path=f"{self.DATA}/ingestion_errors/{self.NOW}.{self.FILE_FORMAT}", data=self.ingestion_errors
+                file_path=f"{self.DATA}/ingestion_errors/{self.started_at}.{self.FILE_FORMAT}",
+                data=self.ingestion_errors,
             )
 
+    def __build_fused_loader(self) -> Any:
+        """Build the fused trusted loader when FUSED_TRUSTED is set, importing pandas and DuckDB only then."""
+        if not self.environment.FUSED_TRUSTED:
+            return None
+        from src.trusted.global_footprint_network.fused import GlobalFootprintNetworkFusedLoader
+
+        return GlobalFootprintNetworkFusedLoader(
+            batch_rows=self.environment.FUSED_BATCH_ROWS, batch_seconds=self.environment.FUSED_BATCH_SECONDS
+        )
+
+    def __on_loaded(
+        self, written: bool, year: int, country_code: str, file_path: str, data: list[dict] | Iterator[bytes]
+    ) -> None:
+        """
+        Run once a payload is persisted: load it into the trusted layer when fused, then checkpoint it
+        and remove it from the dead letters. A payload skipped as unchanged is not loaded: its stored content is
+        already processed or left to the trusted ETL, and its file may have been compacted away.
+        """
+        if self.fused_loader and written:
+            records = data if isinstance(data, list) else None
+            self.fused_loader.load(raw_file=str(self.s3_repository.resolve_path(file_path)), records=records)
+        self.checkpoint.mark_completed(year=year, country_code=country_code)
+        self.dead_letters.remove(year=year, country_code=country_code)
+
     def execute(self) -> None:
-        """Execute the pipeline."""
+        """Execute the pipeline. The instance can be executed again, e.g. by a warm handler."""
+        metrics.reset()
+        self.started_at = datetime.now()
+        self.ingestion_errors = []
+        self.s3_repository.written = self.s3_repository.skipped = 0
         countries = self.get_countries()
         countries_codes = self.get_countries_codes(countries=countries)
-
-        last_successful_year = None
-        last_successful_country = None
+        self.checkpoint.load()
+        self.dead_letters.load()
+        if self.availability:
+            self.availability.load()
+        self.fused_loader = self.__build_fused_loader()
 
         try:
             for year, country_code, data in self.get_footprint_data(
@@ -101,20 +238,127 @@ class GlobalFootprintNetworkAPIRequest(GlobalFootprintNetworkEndpoints):
                 end_year=self.environment.END_YEAR,
             ):  # Lambda 1 API request - using generator to simulate messages to SQS, and avoid memory issues
                 file_path = f"{self.DATA}/{year}/{country_code}.{self.FILE_FORMAT}"
-                self.ingestion.load(file_path=file_path, data=data)  # Lambda 2 ingestion
-
-                last_successful_year = year
-                last_successful_country = country_code
+                self.ingestion.load(
+                    file_path=file_path,
+                    data=data,
+                    on_loaded=partial(
+                        self.__on_loaded, year=year, country_code=country_code, file_path=file_path, data=data
+                    ),
+                )  # Lambda 2 ingestion
 
             self.logger.info("Data ingestion completed successfully.")
 
         finally:
-            if last_successful_year and last_successful_country:
-                self.checkpoint.save_checkpoint(year=last_successful_year, country_code=last_successful_country)
+            for file_path, error in self.ingestion.flush():
+                self.ingestion_errors.append(f"Error loading {file_path}: {error}")
+                year, country_code = Path(strip_raw_extension(file_path)).parts[-2:]
+                self.__record_dead_letter(year=int(year), country_code=country_code, error=error)
+            if self.fused_loader:
+                self.fused_loader.close()
+
+            self.__complete_years(
+                countries_codes=countries_codes,
+                start_year=self.environment.START_YEAR,
+                end_year=self.environment.END_YEAR,
+            )
+            self.checkpoint.flush()
+            self.dead_letters.flush()
+            if self.availability:
+                self.availability.flush()
+                self.logger.info(f"Skipped {self.availability.skipped} requests known to be unavailable")
 
             self.__load_ingestion_errors()
+            self.logger.info(
+                f"Raw files written: {self.s3_repository.written}, skipped as unchanged: {self.s3_repository.skipped}"
+            )
+            if self.response_cache:
+                self.response_cache.flush()
+                self.logger.info(f"HTTP response cache stats: {self.response_cache.stats}")
+            metrics.write_run(
+                s3_repository=self.s3_repository, stage="raw", prometheus_path=self.environment.METRICS_PROMETHEUS_PATH
+            )
+
+    def __replay_pair(self, year: int, country_code: str) -> None:
+        # Transient errors are retried by the client, with the jittered backoff of its RetryPolicy
+        data = self.get_data(country_code=country_code, year=year)
+        if self.availability:
+            self.availability.record(year=year, country_code=country_code, status=AvailabilityIndex.DATA)
+        file_path = f"{self.DATA}/{year}/{country_code}.{self.FILE_FORMAT}"
+        written = self.ingestion.write(file_path=file_path, data=data)
+        self.__on_loaded(written, year=year, country_code=country_code, file_path=file_path, data=data)
+
+    def __stored_countries_codes(self) -> list[str]:
+        """Countries codes of the stored countries file, without requesting the API."""
+        try:
+            countries = self.s3_repository.get_file(file_path=f"{self.COUNTRIES}/{self.COUNTRIES}.{self.FILE_FORMAT}")
+        except FileNotFoundError:
+            return []
+        return self.get_countries_codes(countries=countries)
+
+    def replay(self) -> dict[str, int]:
+        """
+        Replay the dead letters: re-fetch and ingest only their pairs, concurrently with REPLAY_WORKERS threads.
+        Pairs that succeed are removed from the dead letters, the others have their attempts counted.
+
+        Returns:
+            Number of replayed, succeeded and failed pairs
+        """
+        metrics.reset()
+        self.s3_repository.written = self.s3_repository.skipped = 0
+        self.checkpoint.load()
+        self.dead_letters.load()
+        if self.availability:
+            self.availability.load()
+        self.fused_loader = self.__build_fused_loader()
+        dead_letters = self.dead_letters.records()
+        failed = 0
+
+        try:
+            with ThreadPoolExecutor(max_workers=max(self.environment.REPLAY_WORKERS, 1)) as executor:
+                futures = {
+                    executor.submit(self.__replay_pair, record["year"], record["country_code"]): record
+                    for record in dead_letters
+                }
+                for future in as_completed(futures):
+                    if (error := future.exception()) is not None:
+                        record = futures[future]
+                        self.logger.error(f"Replay of {record['country_code']} in {record['year']} failed: {error}")
+                        self.__record_dead_letter(year=record["year"], country_code=record["country_code"], error=error)
+                        failed += 1
+        finally:
+            self.ingestion.flush()
+            if self.fused_loader:
+                self.fused_loader.close()
+            self.__complete_years(
+                countries_codes=self.__stored_countries_codes(),
+                start_year=self.environment.START_YEAR,
+                end_year=self.environment.END_YEAR,
+            )
+            self.checkpoint.flush()
+            self.dead_letters.flush()
+            if self.availability:
+                self.availability.flush()
+            if self.response_cache:
+                self.response_cache.flush()
+            metrics.increment("dead_letters_replayed_total", len(dead_letters) - failed)
+            metrics.increment("dead_letters_failed_total", failed)
+            metrics.write_run(
+                s3_repository=self.s3_repository,
+                stage="raw_replay",
+                prometheus_path=self.environment.METRICS_PROMETHEUS_PATH,
+            )
+
+        self.logger.info(f"Replayed {len(dead_letters)} dead letters: {len(dead_letters) - failed} succeeded")
+        return {"replayed": len(dead_letters), "succeeded": len(dead_letters) - failed, "failed": failed}
 
 
 if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Request Global Footprint Network data and ingest it")
+    parser.add_argument("--replay", action="store_true", help="Only replay the pairs of the dead letters")
+    args = parser.parse_args()
+
     client = GlobalFootprintNetworkAPIRequest()
-    client.execute()
+    if args.replay:
+        client.replay()
+    else:
+        client.execute()
@@ -0,0 +1,46 @@
+import argparse
+
+from src.common.compaction import RawCompaction
+from src.common.environment import Environment
+from src.common.etl.functions.range_years import range_years
+from src.common.logger import Logger
+
+
+class GlobalFootprintNetworkCompaction:
+    """Compaction stage: merge the per-country raw files of each year into one file, like an "all" payload."""
+
+    logger = Logger(__name__)
+    DATA = "data"
+    CODE_COUNTRY_ALL = "all"
+
+    def __init__(self):
+        self.environment = Environment()
+        self.compaction = RawCompaction(
+            bucket_name=self.environment.RAW_PATH,
+            raw_format=self.environment.COMPACTION_FORMAT,
+            excluded_stems={self.CODE_COUNTRY_ALL},
+        )
+
+    def execute(self) -> int:
+        """
+        Compact the years between START_YEAR and END_YEAR with at least COMPACTION_MIN_FILES per-country files,
+        and fold new per-country files into years already compacted.
+
+        Returns:
+            Number of years compacted
+        """
+        compacted_years = 0
+        for year in range_years(self.environment.START_YEAR, self.environment.END_YEAR):
+            manifest = self.compaction.compact(
+                folder=f"{self.DATA}/{year}", min_files=self.environment.COMPACTION_MIN_FILES
+            )
+            compacted_years += manifest is not None
+        self.logger.info(f"Compacted {compacted_years} years")
+        return compacted_years
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Compact the per-country raw files of each year")
+    parser.parse_args()
+
+    GlobalFootprintNetworkCompaction().execute()
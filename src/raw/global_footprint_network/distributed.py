@@ -0,0 +1,241 @@
+import argparse
+import multiprocessing
+import os
+import time
+from datetime import datetime
+from typing import Any
+
+import requests
+
+from src.common.checkpoint import Checkpoint
+from src.common.dead_letter import DeadLetterStore
+from src.common.environment import Environment
+from src.common.etl.functions.range_years import range_years
+from src.common.logger import Logger
+from src.common.metrics import metrics
+from src.common.queues.work_queue import Task, WorkQueue
+from src.raw.global_footprint_network.endpoints import GlobalFootprintNetworkEndpoints
+from src.raw.global_footprint_network.ingestion import GlobalFootprintNetworkIngestion
+
+
+def build_work_queue(environment: Environment) -> WorkQueue:
+    return WorkQueue(
+        path=environment.WORK_QUEUE_PATH,
+        visibility_timeout=environment.WORK_QUEUE_VISIBILITY_SECONDS,
+        max_receives=environment.WORK_QUEUE_MAX_RECEIVES,
+    )
+
+
+class GlobalFootprintNetworkPlanner(GlobalFootprintNetworkEndpoints):
+    """
+    Plan the (year, country) tasks of a run into the work queue, and collect the finished tasks into the checkpoint.
+    Workers never write the checkpoint manifest, so only the planner process owns it.
+    """
+
+    logger = Logger(__name__)
+
+    def __init__(self):
+        super().__init__()
+        self.checkpoint = Checkpoint(bucket_name=self.environment.RAW_PATH)
+        self.dead_letters = DeadLetterStore(bucket_name=self.environment.RAW_PATH)
+        self.work_queue = build_work_queue(self.environment)
+
+    def plan(self) -> int:
+        """
+        Enqueue an "all" task for every valid year not completed yet. A worker finding no "all" payload
+        enqueues a task per country not completed yet, listed in the task.
+
+        Returns:
+            Number of tasks enqueued
+        """
+        countries_codes = sorted(
+            country["countryCode"]
+            for country in self.get_countries()
+            if country["countryCode"] != self.CODE_COUNTRY_ALL
+        )
+        if self.environment.CHECKPOINT:
+            self.checkpoint.load()
+        valide_years = self.get_years()
+
+        tasks = []
+        for year in range_years(self.environment.START_YEAR, self.environment.END_YEAR):
+            if year not in valide_years:
+                self.logger.warning(f"Year {year} not found in valid years")
+                continue
+            if self.__is_completed(year=year, country_code=self.CODE_COUNTRY_ALL):
+                continue
+            pending_codes = [code for code in countries_codes if not self.__is_completed(year=year, country_code=code)]
+            tasks.append({"year": year, "country_code": self.CODE_COUNTRY_ALL, "countries_codes": pending_codes})
+
+        enqueued = self.work_queue.enqueue(tasks)
+        self.logger.info(f"Planned {enqueued} tasks into {self.work_queue.path}")
+        return enqueued
+
+    def __is_completed(self, year: int, country_code: str) -> bool:
+        return self.environment.CHECKPOINT and self.checkpoint.is_completed(year=year, country_code=country_code)
+
+    def collect(self) -> dict[str, int]:
+        """
+        Mark the done tasks as completed in the checkpoint and save the dead tasks as ingestion errors
+        and dead letters, then remove both from the queue. A year whose countries were all completed is completed too.
+
+        Returns:
+            Number of tasks per status before collecting
+        """
+        counts = self.work_queue.counts()
+        self.checkpoint.load()
+        self.dead_letters.load()
+        fanned_out_years = {}
+        for task in self.work_queue.finished(WorkQueue.DONE):
+            year, country_code = task.body["year"], task.body["country_code"]
+            if task.result and "fanned_out" in task.result:
+                fanned_out_years[year] = task.body["countries_codes"]
+                continue
+            self.checkpoint.mark_completed(year=year, country_code=country_code)
+            self.dead_letters.remove(year=year, country_code=country_code)
+        for year, countries_codes in fanned_out_years.items():
+            if all(self.checkpoint.is_completed(year=year, country_code=code) for code in countries_codes):
+                self.checkpoint.mark_completed(year=year, country_code=self.CODE_COUNTRY_ALL)
+        self.checkpoint.flush()
+
+        ingestion_errors = []
+        for task in self.work_queue.finished(WorkQueue.DEAD):
+            year, country_code = task.body["year"], task.body["country_code"]
+            error_class, _, error = (task.last_error or "").partition(": ")
+            ingestion_errors.append(f"Error getting data for {country_code} in {year}: {error}")
+            self.dead_letters.record(
+                year=year,
+                country_code=country_code,
+                endpoint=f"{self.DATA}/{country_code}/{year}",
+                error_class=error_class,
+                error=error,
+            )
+        self.dead_letters.flush()
+        if ingestion_errors:
+            self.s3_repository.upload_file(
+                file_path=f"{self.DATA}/ingestion_errors/{datetime.now()}.{self.FILE_FORMAT}", data=ingestion_errors
+            )
+        self.work_queue.purge(WorkQueue.DONE)
+        self.work_queue.purge(WorkQueue.DEAD)
+        self.logger.info(f"Collected work queue tasks: {counts}")
+        return counts
+
+
+class GlobalFootprintNetworkWorker(GlobalFootprintNetworkEndpoints):
+    """
+    Worker process: claim tasks from the work queue, fetch and ingest their data, and ack them.
+    A failed task is released with an exponential backoff and delivered again until WORK_QUEUE_MAX_RECEIVES.
+    """
+
+    logger = Logger(__name__)
+    POLL_SECONDS = 1.0
+    MAX_BACKOFF_SECONDS = 60.0
+
+    def __init__(self, worker_id: str):
+        """
+        Args:
+            worker_id: Name of the worker, used for its metrics
+        """
+        super().__init__()
+        self.worker_id = worker_id
+        self.work_queue = build_work_queue(self.environment)
+        self.ingestion = GlobalFootprintNetworkIngestion(s3_repository=self.s3_repository)
+
+    def process(self, task: Task) -> dict[str, Any] | None:
+        """
+        Fetch and ingest the data of a task. An "all" task with an empty payload is fanned out to its countries,
+        while request errors are raised so the task is released and delivered again.
+
+        Returns:
+            Result of the task, {"fanned_out": n} for a fanned out "all" task
+        """
+        year, country_code = task.body["year"], task.body["country_code"]
+        if country_code == self.CODE_COUNTRY_ALL:
+            if self.environment.STREAM_ALL_COUNTRIES:
+                data = self.stream_all_countries_data(year=year)
+            else:
+                data = self.get_all_countries_data(year=year)
+            if not data:
+                countries_codes = task.body["countries_codes"]
+                self.work_queue.enqueue({"year": year, "country_code": code} for code in countries_codes)
+                return {"fanned_out": len(countries_codes)}
+        else:
+            data = self.get_data(country_code=country_code, year=year)
+
+        self.ingestion.write(file_path=f"{self.DATA}/{year}/{country_code}.{self.FILE_FORMAT}", data=data)
+        return None
+
+    def run(self) -> int:
+        """
+        Process tasks until the queue is drained: nothing visible and nothing leased by other workers.
+
+        Returns:
+            Number of tasks acked by this worker
+        """
+        metrics.reset()
+        acked = 0
+        try:
+            while True:
+                tasks = self.work_queue.receive()
+                if not tasks:
+                    counts = self.work_queue.counts()
+                    if counts[WorkQueue.PENDING] == 0 and counts["in_flight"] == 0:
+                        break
+                    time.sleep(self.POLL_SECONDS)
+                    continue
+
+                task = tasks[0]
+                try:
+                    result = self.process(task)
+                except (requests.RequestException, OSError, ValueError) as e:
+                    # Other errors stop the worker, and its task is delivered again once its lease expires
+                    delay = min(2**task.receive_count, self.MAX_BACKOFF_SECONDS)
+                    self.logger.error(f"Error processing task {task.body}, retrying in {delay}s: {e}")
+                    self.work_queue.release(task, error=f"{type(e).__name__}: {e}", delay=delay)
+                    continue
+                acked += self.work_queue.ack(task, result=result)
+        finally:
+            self.s3_repository.flush_hash_indexes()
+            if self.response_cache:
+                self.response_cache.flush()
+            self.logger.info(f"Worker {self.worker_id} acked {acked} tasks")
+            metrics.write_run(
+                s3_repository=self.s3_repository,
+                stage=f"raw_worker_{self.worker_id}",
+                prometheus_path=self.environment.METRICS_PROMETHEUS_PATH,
+            )
+        return acked
+
+
+def run_worker(worker_id: str) -> None:
+    GlobalFootprintNetworkWorker(worker_id=worker_id).run()
+
+
+def run(workers: int) -> dict[str, int]:
+    """Plan the tasks, process them with worker processes and collect them."""
+    planner = GlobalFootprintNetworkPlanner()
+    planner.plan()
+    context = multiprocessing.get_context("spawn")
+    processes = [context.Process(target=run_worker, args=(str(index),)) for index in range(workers)]
+    for process in processes:
+        process.start()
+    for process in processes:
+        process.join()
+    return planner.collect()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Run the raw stage through a work queue shared by worker processes")
+    parser.add_argument("command", choices=["plan", "work", "collect", "run"])
+    parser.add_argument("--workers", type=int, default=None, help="Worker processes of run (WORK_QUEUE_WORKERS)")
+    parser.add_argument("--worker-id", default=str(os.getpid()), help="Name of the worker of work")
+    args = parser.parse_args()
+
+    if args.command == "plan":
+        GlobalFootprintNetworkPlanner().plan()
+    elif args.command == "work":
+        run_worker(worker_id=args.worker_id)
+    elif args.command == "collect":
+        GlobalFootprintNetworkPlanner().collect()
+    else:
+        run(workers=args.workers or Environment().WORK_QUEUE_WORKERS)
@@ -1,6 +1,12 @@
-from datetime import datetime
+from collections.abc import Iterator
+from typing import ClassVar
 
+from src.common.clients.adaptive_limiter import AdaptiveConcurrencyLimiter
 from src.common.clients.base_http import BaseHTTPClient
+from src.common.clients.json_stream import peek_empty_json_array
+from src.common.clients.rate_limiter import RateLimiter
+from src.common.clients.response_cache import ResponseCache
+from src.common.clients.retry import RetryPolicy
 from src.common.environment import Environment
 from src.common.logger import Logger
 from src.common.repositories.aws.s3 import S3Repository
@@ -10,21 +16,52 @@ class GlobalFootprintNetworkEndpoints(BaseHTTPClient):
     """Endpoints for the Global Footprint Network API."""
 
     logger = Logger(__name__)
-    BASE_URL = "https://api.footprintnetwork.org/v1"
     COUNTRIES = "countries"
     FILE_FORMAT = "json"
     YEARS = "years"
     DATA = "data"
-    NOW = datetime.now()
     CODE_COUNTRY_ALL = "all"
+    CACHE_TTL: ClassVar[dict[str, int]] = {COUNTRIES: 7 * 24 * 60 * 60, YEARS: 24 * 60 * 60, DATA: 24 * 60 * 60}
 
     default_headers = {"HTTP_ACCEPT": "application/json"}
 
     def __init__(self):
-        super().__init__(self.BASE_URL, default_headers=self.default_headers)
         self.environment = Environment()
+        super().__init__(
+            self.environment.API_BASE_URL,
+            default_headers=self.default_headers,
+            rate_limiter=RateLimiter(requests_per_second=self.environment.REQUESTS_PER_SECOND),
+            response_cache=self.__build_response_cache(),
+            timeout=(self.environment.HTTP_CONNECT_TIMEOUT_SECONDS, self.environment.HTTP_READ_TIMEOUT_SECONDS),
+            retry_policy=RetryPolicy(
+                max_attempts=self.environment.HTTP_MAX_ATTEMPTS,
+                backoff_seconds=self.environment.HTTP_BACKOFF_SECONDS,
+                max_backoff_seconds=self.environment.HTTP_MAX_BACKOFF_SECONDS,
+            ),
+            concurrency_limiter=self.__build_concurrency_limiter(),
+            pool_size=self.environment.HTTP_POOL_SIZE,
+        )
         self.auth_tuple = (self.environment.API_USERNAME, self.environment.API_KEY)
-        self.s3_repository = S3Repository(bucket_name=self.environment.RAW_PATH)
+        self.s3_repository = S3Repository(bucket_name=self.environment.RAW_PATH, raw_format=self.environment.RAW_FORMAT)
+
+    def __build_concurrency_limiter(self) -> AdaptiveConcurrencyLimiter | None:
+        """Build the adaptive limit of requests in flight, disabled unless HTTP_ADAPTIVE_CONCURRENCY is set."""
+        if not self.environment.HTTP_ADAPTIVE_CONCURRENCY:
+            return None
+        return AdaptiveConcurrencyLimiter(
+            max_in_flight=self.environment.HTTP_MAX_IN_FLIGHT,
+            latency_target_seconds=self.environment.HTTP_LATENCY_TARGET_SECONDS,
+        )
+
+    def __build_response_cache(self) -> ResponseCache | None:
+        """Build the HTTP response cache, disabled when HTTP_CACHE_PATH is not set."""
+        if not self.environment.HTTP_CACHE_PATH:
+            return None
+        return ResponseCache(
+            cache_path=self.environment.HTTP_CACHE_PATH,
+            max_bytes=self.environment.HTTP_CACHE_MAX_BYTES,
+            ttl_by_endpoint=self.CACHE_TTL,
+        )
 
     def get_countries(self) -> list[dict]:
         """Get countries from the Global Footprint Network API."""
@@ -48,12 +85,20 @@ class GlobalFootprintNetworkEndpoints(BaseHTTPClient):
             raise e
 
     def get_all_countries_data(self, year: int) -> list[dict]:
-        """Get data for all countries for a given year."""
-        try:
-            return self.get(f"{self.DATA}/{self.CODE_COUNTRY_ALL}/{year}", auth=self.auth_tuple)
-        except Exception as e:
-            self.logger.error(f"Error getting data for all countries for {year}: {e}")
-            return []
+        """
+        Get data for all countries for a given year, an empty list if the year has no "all" payload.
+        Request errors are raised, so callers can tell a failure from a payload which is not available.
+        """
+        return self.get(f"{self.DATA}/{self.CODE_COUNTRY_ALL}/{year}", auth=self.auth_tuple)
+
+    def stream_all_countries_data(self, year: int) -> Iterator[bytes] | None:
+        """
+        Stream the raw data for all countries for a given year, None if the year has no "all" payload.
+        Request errors are raised, like get_all_countries_data.
+        """
+        chunks = self.stream(f"{self.DATA}/{self.CODE_COUNTRY_ALL}/{year}", auth=self.auth_tuple)
+        is_empty, chunks = peek_empty_json_array(chunks)
+        return None if is_empty else chunks
 
     def get_data(self, country_code: str, year: int) -> list[dict]:
         """Get data for a given country and year."""
@@ -0,0 +1,56 @@
+from functools import cache
+from typing import Any
+
+# Handlers import the pipeline lazily, so a cold start only pays for the modules its stage uses.
+# Clients are cached at module level and reused by warm invocations of the same container.
+
+
+@cache
+def get_api_request() -> Any:
+    from src.raw.global_footprint_network.api_request import GlobalFootprintNetworkAPIRequest
+
+    return GlobalFootprintNetworkAPIRequest()
+
+
+@cache
+def get_ingestion() -> Any:
+    from src.raw.global_footprint_network.ingestion import GlobalFootprintNetworkIngestion
+
+    return GlobalFootprintNetworkIngestion()
+
+
+def api_request_handler(event: dict | None = None, context: Any = None) -> dict:
+    """Lambda 1 entry point: request data from the API and ingest it into the raw bucket."""
+    api_request = get_api_request()
+    api_request.execute()
+    return {"ingestion_errors": len(api_request.ingestion_errors)}
+
+
+def replay_handler(event: dict | None = None, context: Any = None) -> dict:
+    """Dead-letter replay entry point: re-fetch only the pairs which failed in previous runs."""
+    return get_api_request().replay()
+
+
+def compaction_handler(event: dict | None = None, context: Any = None) -> dict:
+    """Compaction entry point: merge the per-country raw files of each year into one file."""
+    from src.raw.global_footprint_network.compaction import GlobalFootprintNetworkCompaction
+
+    return {"compacted_years": GlobalFootprintNetworkCompaction().execute()}
+
+
+def ingestion_handler(event: dict, context: Any = None) -> dict:
+    """
+    Lambda 2 entry point: write payloads delivered as SQS messages to the raw bucket.
+
+    Args:
+        event: SQS event, each record body being a JSON message {"file_path": ..., "data": [...]},
+            or a single message
+    """
+    import json
+
+    ingestion = get_ingestion()
+    messages = [json.loads(record["body"]) for record in event["Records"]] if "Records" in event else [event]
+    for message in messages:
+        ingestion.load(file_path=message["file_path"], data=message["data"])
+    errors = ingestion.flush()
+    return {"loaded": len(messages) - len(errors), "errors": [f"{file_path}: {error}" for file_path, error in errors]}
@@ -1,5 +1,8 @@
+from collections.abc import Callable, Iterator
+
 from src.common.environment import Environment
 from src.common.logger import Logger
+from src.common.queues.write_behind import WriteBehindQueue
 from src.common.repositories.aws.s3 import S3Repository
 
 
@@ -7,11 +10,69 @@ class GlobalFootprintNetworkIngestion:
     """ETL for the Global Footprint Network API."""
 
     logger = Logger(__name__)
-    environment = Environment()
 
-    def __init__(self):
-        self.s3_repository = S3Repository(bucket_name=self.environment.RAW_PATH)
+    def __init__(self, s3_repository: S3Repository | None = None):
+        """
+        Args:
+            s3_repository: Repository to write to, shared with the API request when given
+        """
+        self.environment = Environment()
+        self.s3_repository = s3_repository or S3Repository(
+            bucket_name=self.environment.RAW_PATH, raw_format=self.environment.RAW_FORMAT
+        )
+        self.write_behind: WriteBehindQueue | None = None
+
+    def load(
+        self, file_path: str, data: list[dict] | Iterator[bytes], on_loaded: Callable[[bool], None] | None = None
+    ) -> None:
+        """
+        Load data into the S3 repository (Simulate Lambda 2).
+        With WRITE_BEHIND_WORKERS, the write is queued and on_loaded runs once it is persisted.
+        on_loaded is called with whether the file was written, False when skipped as unchanged.
+        """
+        if self.environment.WRITE_BEHIND_WORKERS > 0:
+            if self.write_behind is None:
+                self.write_behind = WriteBehindQueue(
+                    writer=self.write,
+                    workers=self.environment.WRITE_BEHIND_WORKERS,
+                    max_pending=self.environment.WRITE_BEHIND_MAX_PENDING,
+                )
+            self.write_behind.submit(file_path=file_path, data=data, on_done=on_loaded)
+            return
+
+        written = self.write(file_path=file_path, data=data)
+        if on_loaded:
+            on_loaded(written)
+
+    def write(self, file_path: str, data: list[dict] | Iterator[bytes]) -> bool:
+        """
+        Write data to the S3 repository.
+        Decoded payloads are serialized, streamed payloads (raw byte chunks) are written as they arrive.
+        With SKIP_UNCHANGED_RAW, payloads identical to the stored file are not rewritten.
+
+        Returns:
+            Whether the file was written, False when skipped as unchanged
+        """
+        skip_unchanged = self.environment.SKIP_UNCHANGED_RAW
+        if isinstance(data, list):
+            stored_path = self.s3_repository.upload_file(file_path=file_path, data=data, skip_unchanged=skip_unchanged)
+        else:
+            stored_path = self.s3_repository.upload_stream(
+                file_path=file_path, chunks=data, skip_unchanged=skip_unchanged
+            )
+        return stored_path is not None
+
+    def flush(self) -> list[tuple[str, Exception]]:
+        """
+        Wait for queued writes to be persisted and stop the writers, which are started again by the next load.
+        The content hash indexes of the written files are then saved.
 
-    def load(self, file_path: str, data: list[dict]) -> None:
-        """Load data into the S3 repository (Simulate Lambda 2)."""
-        self.s3_repository.upload_file(file_path=file_path, data=data)
+        Returns:
+            List of (file_path, error) for writes that failed
+        """
+        errors = []
+        if self.write_behind is not None:
+            errors = self.write_behind.close()
+            self.write_behind = None
+        self.s3_repository.flush_hash_indexes()
+        return errors
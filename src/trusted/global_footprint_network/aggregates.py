@@ -0,0 +1,138 @@
+import pandas as pd
+
+from src.common.logger import Logger
+from src.common.repositories.snowflake.duckdb import DuckDBRepository
+
+
+class GlobalFootprintNetworkAggregates:
+    """
+    Materialized aggregates of the carbon_footprint table, refreshed incrementally after each load:
+    per-country time series with year-over-year change, world totals and per-year rankings.
+    The source has no region column, so totals are only computed for the world.
+    """
+
+    logger = Logger(__name__)
+    SOURCE_TABLE = "carbon_footprint"
+    TOUCHED_VIEW = "carbon_footprint_touched"
+    COUNTRY_SERIES_TABLE = "carbon_footprint_country_series"
+    WORLD_TOTALS_TABLE = "carbon_footprint_world_totals"
+    RANKINGS_TABLE = "carbon_footprint_rankings"
+
+    def __init__(self, duckdb_repository: DuckDBRepository):
+        self.duckdb_repository = duckdb_repository
+
+    def refresh(self, touched: pd.DataFrame | None = None, years: list[int] | None = None) -> None:
+        """
+        Refresh the aggregates of the rows touched by the latest upsert.
+
+        Args:
+            touched: Distinct (year, country_code) pairs upserted
+            years: Years upserted, all their countries being refreshed (used when touched is not given)
+        """
+        # The touched view lives on the shared connection, so the whole refresh holds the write lock
+        with self.duckdb_repository.writing() as connection:
+            if touched is None:
+                if not years:
+                    return
+                touched = connection.execute(
+                    f"SELECT DISTINCT year, country_code FROM {self.SOURCE_TABLE} WHERE list_contains(?, year)",
+                    [years],
+                ).df()
+            if touched.empty:
+                return
+
+            connection.register(self.TOUCHED_VIEW, touched[["year", "country_code"]].drop_duplicates())
+            try:
+                self.__refresh_country_series()
+                self.__refresh_world_totals()
+                self.__refresh_rankings()
+            finally:
+                connection.unregister(self.TOUCHED_VIEW)
+
+    def __refresh_country_series(self) -> None:
+        # The change of the next year depends on the touched year, so it is refreshed as well
+        self.duckdb_repository.refresh_materialized(
+            table_name=self.COUNTRY_SERIES_TABLE,
+            affected_query=f"""
+            SELECT CAST(year AS BIGINT) AS year, CAST(country_code AS BIGINT) AS country_code FROM {self.TOUCHED_VIEW}
+            UNION
+            SELECT CAST(year AS BIGINT) + 1, CAST(country_code AS BIGINT) FROM {self.TOUCHED_VIEW}
+            """,
+            query=f"""
+            SELECT
+                current.year,
+                current.country_code,
+                current.country_name,
+                current.record,
+                current.carbon,
+                current.carbon - previous.carbon AS carbon_change,
+                (current.carbon - previous.carbon) / NULLIF(previous.carbon, 0) AS carbon_change_pct
+            FROM {self.SOURCE_TABLE} AS current
+            JOIN affected ON current.year = affected.year AND current.country_code = affected.country_code
+            LEFT JOIN {self.SOURCE_TABLE} AS previous
+                ON previous.country_code = current.country_code
+                AND previous.record = current.record
+                AND previous.year = current.year - 1
+            """,
+            key_columns=["year", "country_code"],
+        )
+
+    def __refresh_world_totals(self) -> None:
+        self.duckdb_repository.refresh_materialized(
+            table_name=self.WORLD_TOTALS_TABLE,
+            affected_query=f"SELECT DISTINCT CAST(year AS BIGINT) AS year FROM {self.TOUCHED_VIEW}",
+            query=f"""
+            SELECT
+                source.year,
+                source.record,
+                SUM(source.carbon) AS carbon,
+                COUNT(DISTINCT source.country_code) AS countries
+            FROM {self.SOURCE_TABLE} AS source
+            JOIN affected ON source.year = affected.year
+            GROUP BY source.year, source.record
+            """,
+            key_columns=["year"],
+        )
+
+    def __refresh_rankings(self) -> None:
+        self.duckdb_repository.refresh_materialized(
+            table_name=self.RANKINGS_TABLE,
+            affected_query=f"SELECT DISTINCT CAST(year AS BIGINT) AS year FROM {self.TOUCHED_VIEW}",
+            query=f"""
+            SELECT
+                source.year,
+                source.record,
+                source.country_code,
+                source.country_name,
+                source.carbon,
+                RANK() OVER (PARTITION BY source.year, source.record ORDER BY source.carbon DESC NULLS LAST) AS rank
+            FROM {self.SOURCE_TABLE} AS source
+            JOIN affected ON source.year = affected.year
+            """,
+            key_columns=["year"],
+        )
+
+    def country_series(self, country_code: int, record: str | None = None) -> pd.DataFrame:
+        """Time series of a country, with the change from the previous year."""
+        return self.duckdb_repository.query(
+            f"""
+            SELECT * FROM {self.COUNTRY_SERIES_TABLE}
+            WHERE country_code = ? AND (? IS NULL OR record = ?)
+            ORDER BY record, year
+            """,
+            [country_code, record, record],
+        )
+
+    def world_totals(self, record: str | None = None) -> pd.DataFrame:
+        """World totals per year."""
+        return self.duckdb_repository.query(
+            f"SELECT * FROM {self.WORLD_TOTALS_TABLE} WHERE ? IS NULL OR record = ? ORDER BY record, year",
+            [record, record],
+        )
+
+    def rankings(self, year: int, record: str, top: int = 10) -> pd.DataFrame:
+        """Countries with the highest carbon footprint in a year."""
+        return self.duckdb_repository.query(
+            f"SELECT * FROM {self.RANKINGS_TABLE} WHERE year = ? AND record = ? AND rank <= ? ORDER BY rank",
+            [year, record, top],
+        )
@@ -1,31 +1,99 @@
+import argparse
+import multiprocessing
 import os
+from concurrent.futures import FIRST_COMPLETED, Future, ProcessPoolExecutor, wait
+from typing import ClassVar
 
 import pandas as pd
 
+from src.common.compaction import apply_compaction
 from src.common.environment import Environment
-from src.common.etl.functions import enforce_types, range_years
+from src.common.etl.functions import apply_schema, enforce_types, range_years, validate_schema
 from src.common.etl.mixins.file_system import FileSystemETLMixin
 from src.common.logger import Logger
+from src.common.metrics import metrics
+from src.common.repositories.aws.parquet import ParquetRepository
+from src.common.repositories.aws.s3 import S3Repository
 from src.common.repositories.snowflake.duckdb import DuckDBRepository
+from src.common.schema.base import REJECT_RULE_COLUMN, REJECT_SOURCE_COLUMN
+from src.common.schema.raw_file_manifest import RawFileManifestSchema
+from src.trusted.global_footprint_network.aggregates import GlobalFootprintNetworkAggregates
 from src.trusted.global_footprint_network.schema import GlobalFootprintNetworkSchema
 
 
+def read_and_transform(json_files: list[str]) -> tuple[pd.DataFrame, pd.DataFrame]:
+    """
+    Read and transform raw files in a worker process, which never touches the DuckDB connection.
+
+    Returns:
+        Tuple with the transformed rows and the rows rejected by the validation rules of the schema
+    """
+    environment = Environment()
+    source_column = REJECT_SOURCE_COLUMN if environment.TRUSTED_VALIDATION else None
+    try:
+        data = FileSystemETLMixin().read_json_files_with_pandas(json_files, source_column=source_column)
+    except FileNotFoundError:
+        return pd.DataFrame(), pd.DataFrame()
+    schema = GlobalFootprintNetworkSchema(compact=environment.COMPACT_DTYPES, float32=environment.COMPACT_FLOAT32)
+    if not environment.TRUSTED_VALIDATION:
+        return apply_schema(df=data, schema=schema), pd.DataFrame()
+    return validate_schema(df=data, schema=schema)
+
+
 class GlobalFootprintNetworkTrusted(FileSystemETLMixin):
     """Curated data from the Global Footprint Network API."""
 
     logger = Logger(__name__)
     FILE_FORMAT = "json"
     TABLE_NAME = "carbon_footprint"
+    MANIFEST_TABLE_NAME = "carbon_footprint_raw_files"
+    REJECTS_TABLE_NAME = "carbon_footprint_rejects"
+    VALIDATED_TABLE_NAME = "carbon_footprint_validated"
+    SINKS: ClassVar[dict[str, set[str]]] = {"duckdb": {"duckdb"}, "parquet": {"parquet"}, "both": {"duckdb", "parquet"}}
 
     def __init__(self):
         self.environment = Environment()
-        self.schema = GlobalFootprintNetworkSchema()
+        self.schema = GlobalFootprintNetworkSchema(
+            compact=self.environment.COMPACT_DTYPES, float32=self.environment.COMPACT_FLOAT32
+        )
+        self.manifest_schema = RawFileManifestSchema()
+        if self.environment.TRUSTED_SINK not in self.SINKS:
+            raise ValueError(
+                f"Trusted sink {self.environment.TRUSTED_SINK} not supported, choose one of {list(self.SINKS)}"
+            )
+        self.sinks = self.SINKS[self.environment.TRUSTED_SINK]
+        # The manifest of processed raw files always lives in DuckDB, whatever the sink of the data
         self.duckdb_repository = DuckDBRepository(database_path=self.environment.DATABASE_PATH)
+        self.aggregates = GlobalFootprintNetworkAggregates(duckdb_repository=self.duckdb_repository)
+        self.parquet_repository = ParquetRepository(
+            base_path=os.path.join(self.environment.PARQUET_PATH, self.TABLE_NAME),
+            partition_column="year",
+            row_group_size=self.environment.PARQUET_ROW_GROUP_SIZE,
+        )
+        self._load_buffer: list[tuple[pd.DataFrame, list[dict]]] = []
+        self._buffered_rows = 0
+        self._rejects_buffer: list[pd.DataFrame] = []
 
-    def read(self, year: int) -> pd.DataFrame:
-        file_path = os.path.join(self.environment.RAW_PATH, "data", str(year))
+    def year_path(self, year: int) -> str:
+        return os.path.join(self.environment.RAW_PATH, "data", str(year))
+
+    def list_year_files(self, year: int) -> list[str]:
+        """List the raw files of a year, its compacted file replacing the files it covers."""
+        year_path = self.year_path(year)
+        return apply_compaction(folder_path=year_path, json_files=self.list_json_files(year_path))
+
+    def read(self, year: int, json_files: list[str] | None = None) -> pd.DataFrame:
+        """
+        Read the raw files of a year, only json_files when given.
+        With TRUSTED_VALIDATION, rows carry their raw file in a source_file column, for their rejects.
+        """
+        file_path = self.year_path(year)
         try:
-            return self.read_json_with_pandas(file_path=file_path)
+            json_files = self.list_year_files(year) if json_files is None else json_files
+            if not json_files:
+                raise FileNotFoundError(f"File not found: {file_path}")
+            source_column = REJECT_SOURCE_COLUMN if self.environment.TRUSTED_VALIDATION else None
+            return self.read_json_files_with_pandas(json_files, source_column=source_column)
         except FileNotFoundError:
             self.logger.warning(f"File not found: {file_path}")
             return pd.DataFrame()
@@ -34,33 +102,311 @@ class GlobalFootprintNetworkTrusted(FileSystemETLMixin):
             raise e
 
     def transform(self, df: pd.DataFrame) -> pd.DataFrame:
-        renamed_df = df.rename(columns=self.schema.rename_columns)
-        enforced_df = enforce_types(df=renamed_df, columns=self.schema.enforce_types)
-        selected_df = enforced_df[self.schema.select_columns]
-        return selected_df
+        """
+        Apply the schema to raw rows. With TRUSTED_VALIDATION, rows breaking its rules are buffered as rejects,
+        quarantined in the reject table with the next load, and only valid rows are returned.
+        """
+        with metrics.span("transform"):
+            if self.environment.TRUSTED_VALIDATION:
+                df, rejects = validate_schema(df=df, schema=self.schema)
+                self.buffer_rejects(rejects)
+            else:
+                df = apply_schema(df=df, schema=self.schema)
+        metrics.increment("transform_rows_total", len(df))
+        return df
+
+    def buffer_rejects(self, rejects: pd.DataFrame) -> None:
+        if rejects.empty:
+            return
+        for rule, rows in rejects[REJECT_RULE_COLUMN].value_counts().items():
+            metrics.increment("trusted_rejected_rows_total", rows, rule=rule)
+        self._rejects_buffer.append(rejects)
+
+    def save_rejects(self, rejects_buffer: list[pd.DataFrame], source_files: list[str]) -> None:
+        """
+        Quarantine the rejected rows of loaded raw files in the reject table, with their reject time.
+        The previous rejects of these files are replaced, so reprocessing a file never duplicates its rejects.
+
+        Args:
+            rejects_buffer: Rejected rows, with the raw file of each row in a source_file column
+            source_files: Raw files loaded, including those without rejected rows
+        """
+        if not source_files or not self.environment.TRUSTED_VALIDATION:
+            return
+        rejects = pd.concat(rejects_buffer, ignore_index=True) if rejects_buffer else pd.DataFrame()
+        rejects["rejected_at"] = pd.Timestamp.now()
+        self.duckdb_repository.replace_data_from_pandas(
+            df=rejects,
+            table_name=self.REJECTS_TABLE_NAME,
+            key_column=REJECT_SOURCE_COLUMN,
+            keys=source_files,
+            schema_duckdb=self.schema.reject_schema_duckdb,
+        )
+        if not rejects.empty:
+            self.logger.warning(f"Quarantined {len(rejects)} rejected rows in {self.REJECTS_TABLE_NAME}")
 
     def load(self, df: pd.DataFrame) -> None:
+        if "duckdb" in self.sinks:
+            self.duckdb_repository.upsert_data_from_pandas(
+                df=df,
+                table_name=self.TABLE_NAME,
+                schema_duckdb=self.schema.schema_duckdb,
+                key_columns=self.schema.merge_key_columns,
+            )
+            self.refresh_aggregates(touched=df)
+        if "parquet" in self.sinks and not df.empty:
+            self.parquet_repository.upsert_partitions(df=df, key_columns=self.schema.merge_key_columns)
+
+    def refresh_aggregates(self, touched: pd.DataFrame | None = None, years: list[int] | None = None) -> None:
+        """Refresh the materialized aggregates of the upserted rows, when TRUSTED_AGGREGATES is set."""
+        if not self.environment.TRUSTED_AGGREGATES:
+            return
+        if touched is not None:
+            touched = touched[["year", "country_code"]].drop_duplicates() if not touched.empty else touched
+        self.aggregates.refresh(touched=touched, years=years)
+
+    def buffer_load(self, df: pd.DataFrame, changed_files: list[dict]) -> None:
+        """
+        Buffer a transformed batch and the raw files it comes from.
+        Buffered batches are loaded with a single MERGE once TRUSTED_MERGE_BATCH_ROWS rows are reached.
+        """
+        self._load_buffer.append((df, changed_files))
+        self._buffered_rows += len(df)
+        if self._buffered_rows >= self.environment.TRUSTED_MERGE_BATCH_ROWS:
+            self.flush_loads()
+
+    @property
+    def buffered_rows(self) -> int:
+        return self._buffered_rows
+
+    def flush_loads(self) -> None:
+        """
+        Load every buffered batch with a single MERGE, then quarantine their rejected rows and record their raw files
+        as processed. The buffers are emptied even if the load fails, and the raw files are then left to the next run.
+        """
+        if not self._load_buffer:
+            return
+        load_buffer = self._load_buffer
+        self._load_buffer = []
+        self._buffered_rows = 0
+        rejects_buffer = self._rejects_buffer
+        self._rejects_buffer = []
+        if "duckdb" in self.sinks:
+            self.duckdb_repository.upsert_batches(
+                batches=[df for df, _ in load_buffer],
+                table_name=self.TABLE_NAME,
+                schema_duckdb=self.schema.schema_duckdb,
+                key_columns=self.schema.merge_key_columns,
+            )
+            touched = [df[["year", "country_code"]] for df, _ in load_buffer if not df.empty]
+            if touched:
+                self.refresh_aggregates(touched=pd.concat(touched))
+        if "parquet" in self.sinks:
+            for df, _ in load_buffer:
+                if not df.empty:
+                    self.parquet_repository.upsert_partitions(df=df, key_columns=self.schema.merge_key_columns)
+        fingerprints = [fingerprint for _, changed_files in load_buffer for fingerprint in changed_files]
+        self.save_rejects(rejects_buffer, source_files=[fingerprint["path"] for fingerprint in fingerprints])
+        self.save_processed_files(fingerprints)
+
+    def get_processed_files(self) -> dict[str, dict]:
+        """Get the manifest of raw files already processed, by path."""
+        manifest = self.duckdb_repository.read_table(self.MANIFEST_TABLE_NAME)
+        # Paths recorded before they were normalized still match
+        return {os.path.normpath(row["path"]): row for row in manifest.to_dict(orient="records")}
+
+    def list_changed_files(self, year: int, processed_files: dict[str, dict]) -> tuple[list[dict], list[dict]]:
+        """
+        Compare the raw files of a year with the manifest of processed files.
+        Files with the same size and modification time are unchanged, others are hashed to confirm a change.
+
+        Returns:
+            Tuple with the fingerprints of new or changed files, and of rewritten files with unchanged content
+        """
+        changed_files, rewritten_files = [], []
+        for json_file in self.list_year_files(year):
+            fingerprint = self.file_fingerprint(json_file)
+            processed = processed_files.get(fingerprint["path"])
+            if processed and (processed["size"], processed["mtime"]) == (fingerprint["size"], fingerprint["mtime"]):
+                continue
+
+            fingerprint["content_hash"] = self.file_content_hash(json_file)
+            if processed and processed["content_hash"] == fingerprint["content_hash"]:
+                rewritten_files.append(fingerprint)
+            else:
+                changed_files.append(fingerprint)
+        return changed_files, rewritten_files
+
+    def save_processed_files(self, fingerprints: list[dict]) -> None:
+        """Record raw files as processed in the manifest."""
+        if not fingerprints:
+            return
         self.duckdb_repository.upsert_data_from_pandas(
-            df=df,
-            table_name=self.TABLE_NAME,
-            schema_duckdb=self.schema.schema_duckdb,
-            key_columns=self.schema.merge_key_columns,
+            df=enforce_types(df=pd.DataFrame(fingerprints), columns=self.manifest_schema.enforce_types),
+            table_name=self.MANIFEST_TABLE_NAME,
+            schema_duckdb=self.manifest_schema.schema_duckdb,
+            key_columns=self.manifest_schema.merge_key_columns,
         )
 
-    def execute(self) -> None:
+    def load_with_duckdb(self, json_files: list[str]) -> None:
+        """
+        Read, transform and load raw files in a single DuckDB scan.
+        Renames, casts and column selection of the schema are compiled into the SQL projection.
+        With TRUSTED_VALIDATION, rows breaking the rules of the schema are filtered out in SQL (validate_with_duckdb).
+        """
+        if self.environment.TRUSTED_VALIDATION:
+            self.validate_with_duckdb(json_files=json_files)
+            return
+        query = self.duckdb_repository.read_json_query(json_files=json_files, projection=self.schema.sql_projection)
+        self.__load_query(query=query, json_files=json_files)
+
+    def __load_query(self, query: str, json_files: list[str], df: pd.DataFrame | None = None) -> None:
+        """Load the rows of a query into the sinks, Parquet reading them from df when given."""
+        if "duckdb" in self.sinks:
+            self.duckdb_repository.upsert_data_from_query(
+                query=query,
+                table_name=self.TABLE_NAME,
+                schema_duckdb=self.schema.schema_duckdb,
+                key_columns=self.schema.merge_key_columns,
+            )
+            self.refresh_aggregates(years=self.__years_of_files(json_files))
+        if "parquet" in self.sinks:
+            if df is None:
+                self.parquet_repository.upsert_partitions(query=query, key_columns=self.schema.merge_key_columns)
+            elif not df.empty:
+                self.parquet_repository.upsert_partitions(df=df, key_columns=self.schema.merge_key_columns)
+
+    def validate_with_duckdb(self, json_files: list[str]) -> None:
+        """
+        Evaluate the rules of the schema on a single scan of raw files staged in a table, load the valid rows
+        into the sinks, then quarantine the rejected rows in the reject table.
+        """
+        scan = self.duckdb_repository.read_json_query(
+            json_files=json_files, projection=self.schema.sql_validation_projection
+        )
+        validated = f"SELECT * REPLACE ({self.schema.sql_duplicate_key_rule} AS {REJECT_RULE_COLUMN}) FROM ({scan})"
+        staged = self.VALIDATED_TABLE_NAME
+        self.duckdb_repository.create_table_from_query(table_name=staged, query=validated)
+        try:
+            query = f"SELECT {', '.join(self.schema.select_columns)} FROM {staged} WHERE {REJECT_RULE_COLUMN} IS NULL"
+            # The in-memory Parquet connection can't see the staged table, it gets the valid rows as a DataFrame
+            df = self.duckdb_repository.cursor().execute(query).df() if "parquet" in self.sinks else None
+            self.__load_query(query=query, json_files=json_files, df=df)
+
+            raw_columns = ", ".join(f"raw_{column} AS {column}" for column in self.schema.select_columns)
+            rejects = (
+                self.duckdb_repository.cursor()
+                .execute(
+                    f"SELECT {raw_columns}, {REJECT_RULE_COLUMN}, filename AS {REJECT_SOURCE_COLUMN} "
+                    f"FROM {staged} WHERE {REJECT_RULE_COLUMN} IS NOT NULL"
+                )
+                .df()
+            )
+            self.buffer_rejects(rejects)
+            rejects_buffer, self._rejects_buffer = self._rejects_buffer, []
+            self.save_rejects(rejects_buffer, source_files=json_files)
+        finally:
+            self.duckdb_repository.drop_table(staged)
+
+    def __years_of_files(self, json_files: list[str]) -> list[int]:
+        """Years of raw files, from their data/{year}/ folder."""
+        data_path = os.path.join(self.environment.RAW_PATH, "data")
+        return sorted({int(os.path.relpath(json_file, data_path).split(os.sep)[0]) for json_file in json_files})
+
+    def close(self) -> None:
+        """Close the connections of the sinks."""
+        self.duckdb_repository.close_connection()
+        self.parquet_repository.close_connection()
+
+    def __execute_pandas(self, changed_files_by_year: dict[int, list[dict]]) -> None:
+        for year, changed_files in changed_files_by_year.items():
+            data = self.read(year=year, json_files=[fingerprint["path"] for fingerprint in changed_files])
+            if data.empty:
+                self.logger.warning(f"DataFrame is empty for year {year}")
+                self.buffer_load(df=data, changed_files=changed_files)
+            else:
+                self.buffer_load(df=self.transform(df=data), changed_files=changed_files)
+        self.flush_loads()
+
+    def __execute_pandas_parallel(self, changed_files_by_year: dict[int, list[dict]]) -> None:
+        """
+        Read and transform years in a process pool, loading finished years from this process only,
+        which owns the DuckDB connection. At most TRUSTED_MAX_IN_FLIGHT years are in flight at once.
+        """
+        pending_years = iter(changed_files_by_year.items())
+        in_flight: dict[Future, tuple[int, list[dict]]] = {}
+        with ProcessPoolExecutor(
+            max_workers=self.environment.TRUSTED_WORKERS, mp_context=multiprocessing.get_context("spawn")
+        ) as executor:
+            while True:
+                while len(in_flight) < self.environment.TRUSTED_MAX_IN_FLIGHT:
+                    if (next_year := next(pending_years, None)) is None:
+                        break
+                    year, changed_files = next_year
+                    json_files = [fingerprint["path"] for fingerprint in changed_files]
+                    in_flight[executor.submit(read_and_transform, json_files)] = next_year
+                if not in_flight:
+                    break
+
+                done, _ = wait(in_flight, return_when=FIRST_COMPLETED)
+                for future in done:
+                    year, changed_files = in_flight.pop(future)
+                    transformed_data, rejects = future.result()
+                    self.buffer_rejects(rejects)
+                    if transformed_data.empty:
+                        self.logger.warning(f"DataFrame is empty for year {year}")
+                    self.buffer_load(df=transformed_data, changed_files=changed_files)
+        self.flush_loads()
+
+    def __execute_duckdb(self, changed_files_by_year: dict[int, list[dict]]) -> None:
+        changed_files = [fingerprint for files in changed_files_by_year.values() for fingerprint in files]
+        if not changed_files:
+            return
+        self.load_with_duckdb(json_files=[fingerprint["path"] for fingerprint in changed_files])
+        self.save_processed_files(changed_files)
+
+    def execute(self, full_refresh: bool = False) -> None:
+        """
+        Process raw files new or changed since the last run.
+        With TRUSTED_READER=duckdb, the files of all years are scanned by DuckDB in one pass instead of pandas.
+        Otherwise, TRUSTED_WORKERS > 1 reads and transforms years in parallel processes.
+        Data is loaded into the TRUSTED_SINK: the DuckDB table, Hive-partitioned Parquet files or both.
+
+        Args:
+            full_refresh: Ignore the manifest of processed files and reprocess every year
+        """
+        metrics.reset()
         years = range_years(self.environment.START_YEAR, self.environment.END_YEAR)
         try:
+            processed_files = {} if full_refresh else self.get_processed_files()
+            changed_files_by_year = {}
             for year in years:
-                data = self.read(year=year)
-                if data.empty:
-                    self.logger.warning(f"DataFrame is empty for year {year}")
+                changed_files, rewritten_files = self.list_changed_files(year=year, processed_files=processed_files)
+                self.save_processed_files(rewritten_files)
+                if not changed_files:
+                    self.logger.info(f"No new or changed raw files for year {year}")
                     continue
-                transformed_data = self.transform(df=data)
-                self.load(df=transformed_data)
+                changed_files_by_year[year] = changed_files
+
+            if self.environment.TRUSTED_READER == "duckdb":
+                self.__execute_duckdb(changed_files_by_year)
+            elif self.environment.TRUSTED_WORKERS > 1:
+                self.__execute_pandas_parallel(changed_files_by_year)
+            else:
+                self.__execute_pandas(changed_files_by_year)
         finally:
-            self.duckdb_repository.close_connection()
+            self.close()
+            metrics.write_run(
+                s3_repository=S3Repository(bucket_name=self.environment.RAW_PATH),
+                stage="trusted",
+                prometheus_path=self.environment.METRICS_PROMETHEUS_PATH,
+            )
 
 
 if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Load Global Footprint Network raw files into the trusted layer")
+    parser.add_argument("--full-refresh", action="store_true", help="Reprocess every year, ignoring the manifest")
+    args = parser.parse_args()
+
     client = GlobalFootprintNetworkTrusted()
-    client.execute()
+    client.execute(full_refresh=args.full_refresh)
@@ -0,0 +1,103 @@
+import threading
+import time
+
+import duckdb
+import pandas as pd
+
+from src.common.logger import Logger
+from src.common.metrics import metrics
+from src.common.schema.base import REJECT_SOURCE_COLUMN
+from src.trusted.global_footprint_network.etl import GlobalFootprintNetworkTrusted
+
+# Errors of a payload (unreadable file, bad records, failed upsert) which leave it to the trusted ETL
+LOAD_ERRORS = (OSError, ValueError, KeyError, TypeError, duckdb.Error)
+
+
+class GlobalFootprintNetworkFusedLoader:
+    """
+    Load raw payloads into the trusted layer as soon as they are persisted, in the same run as the API request.
+    Records are transformed in memory and upserted in micro-batches, and their raw files are recorded as processed,
+    so the trusted ETL doesn't parse them again. A timer thread upserts buffered records batch_seconds after
+    the last upsert, even when no payload follows. Failed loads are only logged: their raw files stay unprocessed
+    and are picked up by the next trusted run.
+    """
+
+    logger = Logger(__name__)
+
+    def __init__(self, batch_rows: int, batch_seconds: float):
+        """
+        Args:
+            batch_rows: Upsert buffered records once this many rows are buffered
+            batch_seconds: Upsert buffered records when this many seconds passed since the last upsert
+        """
+        self.trusted = GlobalFootprintNetworkTrusted()
+        self.batch_rows = batch_rows
+        self.batch_seconds = batch_seconds
+        self._lock = threading.Lock()  # payloads may be persisted by write-behind threads
+        self._last_flush = time.monotonic()
+        self._closed = threading.Event()
+        self._timer = threading.Thread(target=self.__flush_periodically, name="fused-flush", daemon=True)
+        self._timer.start()
+
+    def load(self, raw_file: str, records: list[dict] | None = None) -> None:
+        """
+        Transform and buffer the records of a persisted raw file.
+
+        Args:
+            raw_file: Path of the stored raw file
+            records: Records of the file, read back from the file when not given (e.g. streamed payloads)
+        """
+        with self._lock:
+            try:
+                fingerprint = self.trusted.file_fingerprint(raw_file)
+                fingerprint["content_hash"] = self.trusted.file_content_hash(raw_file)
+                df = (
+                    pd.DataFrame(records)
+                    if records is not None
+                    else self.trusted.read_json_files_with_pandas([raw_file])
+                )
+                if self.trusted.environment.TRUSTED_VALIDATION:
+                    df[REJECT_SOURCE_COLUMN] = fingerprint["path"]
+                if not df.empty:
+                    df = self.trusted.transform(df=df)
+                self.trusted.buffer_load(df=df, changed_files=[fingerprint])
+                metrics.increment("fused_rows_total", len(df))
+
+                if (
+                    self.trusted.buffered_rows >= self.batch_rows
+                    or time.monotonic() - self._last_flush >= self.batch_seconds
+                ):
+                    self.__flush()
+            except LOAD_ERRORS as e:
+                metrics.increment("fused_errors_total")
+                self.logger.error(f"Error loading {raw_file} into the trusted layer, left to the trusted ETL: {e}")
+
+    def __flush(self) -> None:
+        self._last_flush = time.monotonic()
+        with metrics.span("fused_flush"):
+            self.trusted.flush_loads()
+
+    def __flush_periodically(self) -> None:
+        """Upsert the buffered records once batch_seconds passed since the last upsert, until closed."""
+        while not self._closed.wait(timeout=max(self._last_flush + self.batch_seconds - time.monotonic(), 0.1)):
+            with self._lock:
+                if self._closed.is_set() or time.monotonic() - self._last_flush < self.batch_seconds:
+                    continue
+                try:
+                    self.__flush()
+                except LOAD_ERRORS as e:
+                    metrics.increment("fused_errors_total")
+                    self.logger.error(f"Error flushing records into the trusted layer, left to the trusted ETL: {e}")
+
+    def close(self) -> None:
+        """Stop the timer, upsert the remaining buffered records and close the trusted sinks."""
+        self._closed.set()
+        self._timer.join()
+        with self._lock:
+            try:
+                self.__flush()
+            except LOAD_ERRORS as e:
+                metrics.increment("fused_errors_total")
+                self.logger.error(f"Error flushing records into the trusted layer, left to the trusted ETL: {e}")
+            finally:
+                self.trusted.close()
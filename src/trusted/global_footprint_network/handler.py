@@ -0,0 +1,16 @@
+from typing import Any
+
+
+def handler(event: dict | None = None, context: Any = None) -> dict:
+    """
+    Trusted ETL entry point, importing pandas and DuckDB on the first invocation only.
+    The ETL is built per invocation, since it closes its DuckDB connection so other processes can open the database.
+
+    Args:
+        event: Optional {"full_refresh": true} to reprocess every year
+    """
+    from src.trusted.global_footprint_network.etl import GlobalFootprintNetworkTrusted
+
+    full_refresh = bool((event or {}).get("full_refresh", False))
+    GlobalFootprintNetworkTrusted().execute(full_refresh=full_refresh)
+    return {"full_refresh": full_refresh}